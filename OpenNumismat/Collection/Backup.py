@@ -0,0 +1,258 @@
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+from urllib.request import pathname2url
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class BackupCanceled(Exception):
+    pass
+
+
+class BackupStore:
+    """Incremental backups of collection file.
+
+    Consistent snapshot of collection made by SQLite online backup API is
+    split into chunks stored once by content hash, so unchanged parts of
+    collection are shared by all backups. Each backup is a manifest listing
+    chunks of its snapshot.
+    """
+    VERSION = 1
+    # Multiple of any SQLite page size
+    CHUNK_SIZE = 64 * 1024
+    # Pages copied by one step of online backup, database isn't locked
+    # between steps
+    SNAPSHOT_STEP_PAGES = 256
+    NAME_FORMAT = '%y%m%d%H%M%S'
+
+    def __init__(self, directory, name):
+        self.directory = os.path.join(directory, name + '_backup')
+        self.chunksDirectory = os.path.join(self.directory, 'chunks')
+        self.imagesDirectory = os.path.join(self.directory, 'images')
+
+    def backups(self):
+        names = []
+        if os.path.isdir(self.directory):
+            for fileName in os.listdir(self.directory):
+                name, ext = os.path.splitext(fileName)
+                if ext == '.json':
+                    names.append(name)
+
+        return sorted(names)
+
+    def manifest(self, name):
+        with open(self.__manifestFileName(name), encoding='utf-8') as f:
+            return json.load(f)
+
+    def latest(self):
+        for name in reversed(self.backups()):
+            try:
+                return self.manifest(name)
+            except (OSError, ValueError):
+                continue
+
+        return None
+
+    def backup(self, fileName, keep, progress=None):
+        """Makes new backup.
+
+        progress(done, total) is called while copying pages of snapshot and
+        while storing its chunks, returning False cancels backup by raising
+        BackupCanceled.
+        """
+        os.makedirs(self.chunksDirectory, exist_ok=True)
+
+        name = datetime.datetime.now().strftime(self.NAME_FORMAT)
+        snapshotFileName = os.path.join(self.directory, name + '.tmp')
+        try:
+            manifest = self.__snapshot(fileName, snapshotFileName, progress)
+
+            size = os.path.getsize(snapshotFileName)
+            total = (size + self.CHUNK_SIZE - 1) // self.CHUNK_SIZE
+            chunks = []
+            with open(snapshotFileName, 'rb') as f:
+                while True:
+                    data = f.read(self.CHUNK_SIZE)
+                    if not data:
+                        break
+
+                    chunks.append(self.__storeChunk(data))
+                    self.__progress(progress, len(chunks), total)
+
+            manifest['size'] = size
+            manifest['chunks'] = chunks
+            self.__writeManifest(name, manifest)
+        finally:
+            if os.path.exists(snapshotFileName):
+                os.remove(snapshotFileName)
+
+        self.cleanup(keep)
+
+    def restore(self, name, fileName, progress=None):
+        """Restores backup to fileName, progress is same as for backup()"""
+        manifest = self.manifest(name)
+        chunks = manifest['chunks']
+
+        tmpFileName = fileName + '.tmp'
+        try:
+            with open(tmpFileName, 'wb') as f:
+                for i, hash_ in enumerate(chunks):
+                    f.write(self.__loadChunk(hash_))
+                    self.__progress(progress, i + 1, len(chunks))
+
+                if f.tell() != manifest['size']:
+                    raise ValueError("Backup %s is damaged" % name)
+
+            db = sqlite3.connect(tmpFileName)
+            try:
+                result = db.execute("PRAGMA quick_check").fetchone()
+            finally:
+                db.close()
+            if result[0] != 'ok':
+                raise ValueError("Backup %s is damaged" % name)
+
+            os.replace(tmpFileName, fileName)
+        finally:
+            if os.path.exists(tmpFileName):
+                os.remove(tmpFileName)
+
+    def cleanup(self, keep):
+        """Retention policy: keeps only latest backups, their chunks and
+        external images"""
+        names = self.backups()
+        for name in names[:-keep]:
+            os.remove(self.__manifestFileName(name))
+
+        used = set()
+        usedImages = set()
+        for name in names[-keep:]:
+            try:
+                manifest = self.manifest(name)
+                used.update(manifest['chunks'])
+            except (OSError, ValueError, KeyError):
+                # Don't remove anything while any manifest is unreadable
+                return
+
+            if usedImages is not None:
+                if 'images' in manifest:
+                    usedImages.update(manifest['images'])
+                else:
+                    # Images of older backups are unknown
+                    usedImages = None
+
+        for dirpath, _dirnames, filenames in os.walk(self.chunksDirectory):
+            for fileName in filenames:
+                if fileName not in used:
+                    os.remove(os.path.join(dirpath, fileName))
+
+        if usedImages is not None:
+            for dirpath, _dirnames, filenames in os.walk(self.imagesDirectory):
+                for fileName in filenames:
+                    if fileName not in usedImages:
+                        os.remove(os.path.join(dirpath, fileName))
+
+    @staticmethod
+    def __progress(progress, done, total):
+        if progress and progress(done, total) is False:
+            raise BackupCanceled()
+
+    def __snapshot(self, fileName, snapshotFileName, progress):
+        def stepProgress(_status, remaining, total):
+            self.__progress(progress, total - remaining, total)
+
+        uri = 'file:%s?mode=ro' % pathname2url(os.path.abspath(fileName))
+        src = sqlite3.connect(uri, uri=True)
+        dst = sqlite3.connect(snapshotFileName)
+        try:
+            # Backup is restarted by SQLite when collection is changed
+            # between steps, so snapshot is always consistent
+            src.backup(dst, pages=self.SNAPSHOT_STEP_PAGES,
+                       progress=stepProgress)
+            updatedat, count = dst.execute(
+                "SELECT max(updatedat), count(*) FROM coins").fetchone()
+            images = [row[0] for row in dst.execute(
+                "SELECT hash FROM photos WHERE image IS NULL"
+                " AND hash IS NOT NULL")]
+        finally:
+            dst.close()
+            src.close()
+
+        return {'version': self.VERSION,
+                'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                'updatedat': updatedat,
+                'coins': count,
+                'images': images}
+
+    def __chunkFileName(self, hash_):
+        return os.path.join(self.chunksDirectory, hash_[:2], hash_)
+
+    def __storeChunk(self, data):
+        hash_ = hashlib.sha1(data).hexdigest()
+        fileName = self.__chunkFileName(hash_)
+        if not os.path.isfile(fileName):
+            os.makedirs(os.path.dirname(fileName), exist_ok=True)
+            tmpFileName = fileName + '.tmp'
+            with open(tmpFileName, 'wb') as f:
+                # Most of chunks are images, so fast compression is enough
+                f.write(zlib.compress(data, 1))
+            os.replace(tmpFileName, fileName)
+
+        return hash_
+
+    def __loadChunk(self, hash_):
+        with open(self.__chunkFileName(hash_), 'rb') as f:
+            data = zlib.decompress(f.read())
+
+        if hashlib.sha1(data).hexdigest() != hash_:
+            raise ValueError("Backup chunk %s is damaged" % hash_)
+
+        return data
+
+    def __manifestFileName(self, name):
+        return os.path.join(self.directory, name + '.json')
+
+    def __writeManifest(self, name, manifest):
+        fileName = self.__manifestFileName(name)
+        tmpFileName = fileName + '.tmp'
+        with open(tmpFileName, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmpFileName, fileName)
+
+
+class BackupThread(QThread):
+    """Makes backup of collection file without blocking GUI"""
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, store, fileName, keep, photos, parent=None):
+        super().__init__(parent)
+
+        self.store = store
+        self.fileName = fileName
+        self.keep = keep
+        self.photos = photos
+        self.canceled = False
+        self.error = None
+
+    def cancel(self):
+        self.canceled = True
+
+    def run(self):
+        try:
+            self.store.backup(self.fileName, self.keep, self.__progress)
+
+            # External images are shared by all backups of collection, so
+            # only new ones are copied
+            if not self.photos.backup(self.store.imagesDirectory):
+                self.error = self.store.imagesDirectory
+        except BackupCanceled:
+            self.canceled = True
+        except (OSError, sqlite3.Error) as error:
+            self.error = str(error)
+
+    def __progress(self, done, total):
+        self.progress.emit(done, total)
+        return not self.canceled
@@ -1,17 +1,25 @@
 import locale
 import os
+import sqlite3
 
 from PyQt5 import QtCore
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import QImage, QPainter, QColor
 from PyQt5.QtCore import Qt, pyqtSignal
-from PyQt5.QtSql import QSqlTableModel, QSqlDatabase, QSqlQuery, QSqlField
+from PyQt5.QtSql import QSqlTableModel, QSqlDatabase, QSqlQuery, QSqlField, QSqlRecord
 
 from OpenNumismat.Collection.CollectionFields import CollectionFieldsBase
 from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
 from OpenNumismat.Collection.CollectionFields import CollectionFields
 from OpenNumismat.Collection.CollectionFields import ImageFields
 from OpenNumismat.Collection.CollectionPages import CollectionPages
+from OpenNumismat.Collection.IndexManager import IndexManager
+from OpenNumismat.Collection.SearchIndex import SearchIndex
+from OpenNumismat.Collection.Merge import Merge
+from OpenNumismat.Collection.PhotoStore import PhotoStore
+from OpenNumismat.Collection.Backup import BackupStore, BackupThread, BackupCanceled
+from OpenNumismat.Collection.FilterExpr import Expr, Raw, And, ValueTables
+from OpenNumismat.Collection.StatisticsCache import StatisticsCache
 from OpenNumismat.Collection.Password import cryptPassword, PasswordDialog
 from OpenNumismat.Collection.Description import CollectionDescription
 from OpenNumismat.Reference.Reference import Reference
@@ -19,6 +27,7 @@ from OpenNumismat.Reference.Reference import CrossReferenceSection
 from OpenNumismat.Reference.ReferenceDialog import AllReferenceDialog
 from OpenNumismat.EditCoinDialog.EditCoinDialog import EditCoinDialog
 from OpenNumismat.Collection.CollectionFields import Statuses
+from OpenNumismat.Collection.CollectionFields import StatusesOrder
 from OpenNumismat.Collection.VersionUpdater import updateCollection
 from OpenNumismat.Tools.CursorDecorators import waitCursorDecorator
 from OpenNumismat.Tools import Gui
@@ -26,6 +35,8 @@ from OpenNumismat.Settings import Settings, BaseSettings
 from OpenNumismat import version
 from OpenNumismat.Collection.Export import ExportDialog
 from OpenNumismat.Tools.Converters import numberWithFraction, htmlToPlainText
+from OpenNumismat.Tools.Cache import LruCache
+from OpenNumismat.Tools.StatementPool import StatementPool
 
 
 class CollectionModel(QSqlTableModel):
@@ -40,12 +51,41 @@ class CollectionModel(QSqlTableModel):
         self.intFilter = ''
         self.extFilter = ''
         self.searchFilter = ''
+        # Search results are stored in temporary table for narrowing them
+        # by next search
+        self.searchSql = ''
+        self.searchTable = 'search_%d' % id(self)
+        self.searchRevision = None
+        # Large value lists of filters are stored in temporary tables
+        self.valueTables = ValueTables(collection.db, 'values_%d_' % id(self))
+        self.filterTables = set()
 
         self.reference = collection.reference
         self.fields = collection.fields
         self.description = collection.description
         self.settings = collection.settings
+        self.imageCache = collection.imageCache
+        self.filterValuesCache = collection.filterValuesCache
+        self.statements = collection.statements
+        self.photos = collection.photos
+        self.previews = collection.previews
+        self.searchIndex = collection.searchIndex
+        # Changed coins are reported to all pages after submitting as list
+        # of (record, delta)
+        self.coinsChanged = collection.coinsChanged
+        self.changedRecords = []
+        # Data revision before first not submitted change
+        self.changesRevision = None
+        self.submitting = False
+        self.statisticsCache = collection.statisticsCache
+        self.collection = collection
         self.proxy = None
+        self.sortColumn = -1
+        self.sortOrder = Qt.AscendingOrder
+
+        # Formatted values for Qt.DisplayRole
+        self.displayCache = {}
+        self.displayCacheFraction = self.settings['convert_fraction']
 
         self.rowsInserted.connect(self.rowsInsertedEvent)
 
@@ -55,61 +95,37 @@ class CollectionModel(QSqlTableModel):
     def rowsInsertedEvent(self, parent, start, end):
         self.insertedRowIndex = self.index(end, 0)
 
+    def clearDisplayCache(self):
+        self.displayCache.clear()
+        self.displayCacheFraction = self.settings['convert_fraction']
+
     def data(self, index, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
-            # Localize values
-            data = super().data(index, role)
-            field = self.fields.fields[index.column()]
+            if self.displayCacheFraction != self.settings['convert_fraction']:
+                self.clearDisplayCache()
+
+            key = (index.row(), index.column())
             try:
-                if field.name == 'status':
-                    text = Statuses[data]
-                elif field.name == 'year':
-                    year = int(data)
-                    if year < 0:
-                        text = "%d BC" % -year
-                    else:
-                        text = str(data)
-                elif field.type == Type.BigInt:
-                    text = locale.format("%d", int(data), grouping=True)
-                elif field.type == Type.Text:
-                    text = htmlToPlainText(data)
-                elif field.type == Type.Money:
-                    text = locale.format("%.2f", float(data), grouping=True)
-                    dp = locale.localeconv()['decimal_point']
-                    text = text.rstrip('0').rstrip(dp)
-                elif field.type == Type.Denomination:
-                    text, converted = numberWithFraction(data, self.settings['convert_fraction'])
-                    if not converted:
-                        text = locale.format("%.2f", float(data), grouping=True)
-                        dp = locale.localeconv()['decimal_point']
-                        text = text.rstrip('0').rstrip(dp)
-                elif field.type == Type.Value:
-                    text = locale.format("%.3f", float(data), grouping=True)
-                    dp = locale.localeconv()['decimal_point']
-                    text = text.rstrip('0').rstrip(dp)
-                elif field.type == Type.PreviewImage:
-                    if data:
-                        return self.getPreviewImage(data)
-                    else:
-                        return None
-                elif field.type == Type.Image:
-                    if data:
-                        return self.getImage(data)
-                    else:
-                        return None
-                elif field.type == Type.Date:
-                    date = QtCore.QDate.fromString(data, Qt.ISODate)
-                    text = date.toString(Qt.SystemLocaleShortDate)
-                elif field.type == Type.DateTime:
-                    date = QtCore.QDateTime.fromString(data, Qt.ISODate)
-                    # Timestamp in DB stored in UTC
-                    date.setTimeSpec(Qt.UTC)
-                    date = date.toLocalTime()
-                    text = date.toString(Qt.SystemLocaleShortDate)
+                return self.displayCache[key]
+            except KeyError:
+                pass
+
+            field = self.fields.fields[index.column()]
+            if field.type == Type.PreviewImage:
+                data = super().data(index, role)
+                if data:
+                    return self.getPreviewImage(data)
                 else:
-                    return data
-            except (ValueError, TypeError):
-                return data
+                    return None
+            elif field.type == Type.Image:
+                data = super().data(index, role)
+                if data:
+                    return self.getImage(data)
+                else:
+                    return None
+
+            text = self.__displayText(index, field)
+            self.displayCache[key] = text
             return text
         elif role == Qt.UserRole:
             field = self.fields.fields[index.column()]
@@ -136,6 +152,51 @@ class CollectionModel(QSqlTableModel):
 
         return super().data(index, role)
 
+    def __displayText(self, index, field):
+        # Localize values
+        data = super().data(index, Qt.DisplayRole)
+        try:
+            if field.name == 'status':
+                text = Statuses[data]
+            elif field.name == 'year':
+                year = int(data)
+                if year < 0:
+                    text = "%d BC" % -year
+                else:
+                    text = str(data)
+            elif field.type == Type.BigInt:
+                text = locale.format("%d", int(data), grouping=True)
+            elif field.type == Type.Text:
+                text = htmlToPlainText(data)
+            elif field.type == Type.Money:
+                text = locale.format("%.2f", float(data), grouping=True)
+                dp = locale.localeconv()['decimal_point']
+                text = text.rstrip('0').rstrip(dp)
+            elif field.type == Type.Denomination:
+                text, converted = numberWithFraction(data, self.settings['convert_fraction'])
+                if not converted:
+                    text = locale.format("%.2f", float(data), grouping=True)
+                    dp = locale.localeconv()['decimal_point']
+                    text = text.rstrip('0').rstrip(dp)
+            elif field.type == Type.Value:
+                text = locale.format("%.3f", float(data), grouping=True)
+                dp = locale.localeconv()['decimal_point']
+                text = text.rstrip('0').rstrip(dp)
+            elif field.type == Type.Date:
+                date = QtCore.QDate.fromString(data, Qt.ISODate)
+                text = date.toString(Qt.SystemLocaleShortDate)
+            elif field.type == Type.DateTime:
+                date = QtCore.QDateTime.fromString(data, Qt.ISODate)
+                # Timestamp in DB stored in UTC
+                date.setTimeSpec(Qt.UTC)
+                date = date.toLocalTime()
+                text = date.toString(Qt.SystemLocaleShortDate)
+            else:
+                return data
+        except (ValueError, TypeError):
+            return data
+        return text
+
     def dataDisplayRole(self, index):
         return super().data(index, Qt.DisplayRole)
 
@@ -160,6 +221,9 @@ class CollectionModel(QSqlTableModel):
                 self.rowInserted.emit(self.insertedRowIndex)
 
     def insertRecord(self, row, record):
+        self.clearDisplayCache()
+        self.__beginChange()
+        self.loadImages(record)
         self._updateRecord(record)
         record.setNull('id')  # remove ID value from record
         record.setValue('createdat', record.value('updatedat'))
@@ -175,13 +239,7 @@ class CollectionModel(QSqlTableModel):
         for field in ImageFields:
             value = record.value(field)
             if value:
-                query = QSqlQuery(self.database())
-                query.prepare("INSERT INTO photos (title, image) VALUES (?, ?)")
-                query.addBindValue(record.value(field + '_title'))
-                query.addBindValue(value)
-                query.exec_()
-
-                img_id = query.lastInsertId()
+                img_id = self.photos.add(value, record.value(field + '_title'))
             else:
                 img_id = None
 
@@ -191,12 +249,7 @@ class CollectionModel(QSqlTableModel):
 
         value = record.value('image')
         if value:
-            query = QSqlQuery(self.database())
-            query.prepare("INSERT INTO images (image) VALUES (?)")
-            query.addBindValue(value)
-            query.exec_()
-
-            img_id = query.lastInsertId()
+            img_id = self.previews.add(value)
         else:
             img_id = None
         self.database().commit()
@@ -204,40 +257,36 @@ class CollectionModel(QSqlTableModel):
         record.setValue('image', img_id)
         record.remove(record.indexOf('image_id'))
 
+        self.changedRecords.append((QSqlRecord(record), 1))
+
         return super().insertRecord(row, record)
 
     def setRecord(self, row, record):
+        self.clearDisplayCache()
         self._updateRecord(record)
+        self.__beginChange()
+        self.changedRecords.append((super().record(row), -1))
 
         self.database().transaction()
-        # TODO : check that images was realy changed
+        # Unchanged images are found by hash and keep their IDs
         for field in ImageFields:
             img_id = record.value(field + '_id')
             value = record.value(field)
-            if not value:
+            if self.isLazyImage(record, field):
+                # Not loaded image can't be changed
+                pass
+            elif not value:
                 if img_id:
-                    query = QSqlQuery(self.database())
-                    query.prepare("DELETE FROM photos WHERE id=?")
-                    query.addBindValue(img_id)
-                    query.exec_()
-
+                    self.photos.release(img_id)
+                    self.imageCache.remove(('photos', img_id))
                     img_id = None
             else:
+                title = record.value(field + '_title')
                 if img_id:
-                    query = QSqlQuery(self.database())
-                    query.prepare("UPDATE photos SET title=?, image=? WHERE id=?")
-                    query.addBindValue(record.value(field + '_title'))
-                    query.addBindValue(record.value(field))
-                    query.addBindValue(img_id)
-                    query.exec_()
+                    self.imageCache.remove(('photos', img_id))
+                    img_id = self.photos.replace(img_id, value, title)
                 else:
-                    query = QSqlQuery(self.database())
-                    query.prepare("INSERT INTO photos (title, image) VALUES (?, ?)")
-                    query.addBindValue(record.value(field + '_title'))
-                    query.addBindValue(record.value(field))
-                    query.exec_()
-
-                    img_id = query.lastInsertId()
+                    img_id = self.photos.add(value, title)
 
             if img_id:
                 record.setValue(field, img_id)
@@ -248,28 +297,19 @@ class CollectionModel(QSqlTableModel):
 
         img_id = record.value('image_id')
         value = record.value('image')
-        if not value:
+        if self.isLazyImage(record, 'image'):
+            pass
+        elif not value:
             if img_id:
-                query = QSqlQuery(self.database())
-                query.prepare("DELETE FROM images WHERE id=?")
-                query.addBindValue(img_id)
-                query.exec_()
-
+                self.previews.release(img_id)
+                self.imageCache.remove(('images', img_id))
                 img_id = None
         else:
             if img_id:
-                query = QSqlQuery(self.database())
-                query.prepare("UPDATE images SET image=? WHERE id=?")
-                query.addBindValue(record.value('image'))
-                query.addBindValue(img_id)
-                query.exec_()
+                self.imageCache.remove(('images', img_id))
+                img_id = self.previews.replace(img_id, value)
             else:
-                query = QSqlQuery(self.database())
-                query.prepare("INSERT INTO images (image) VALUES (?)")
-                query.addBindValue(record.value('image'))
-                query.exec_()
-
-                img_id = query.lastInsertId()
+                img_id = self.previews.add(value)
         self.database().commit()
 
         if img_id:
@@ -278,23 +318,30 @@ class CollectionModel(QSqlTableModel):
             record.setNull('image')
         record.remove(record.indexOf('image_id'))
 
+        self.changedRecords.append((QSqlRecord(record), 1))
+
         return super().setRecord(row, record)
 
-    def record(self, row=-1):
+    def record(self, row=-1, lazy=False):
+        """Returns record with images data.
+        With lazy=True image fields keep image IDs, use loadImages() for
+        getting required images data."""
         if row >= 0:
             record = super().record(row)
         else:
             record = super().record()
 
+        ids = [record.value(field) for field in ImageFields]
+        ids = [img_id for img_id in ids if img_id]
+        titles = self.getImageTitles(ids)
+
         for field in ImageFields:
             record.append(QSqlField(field + '_title'))
             record.append(QSqlField(field + '_id'))
 
             img_id = record.value(field)
             if img_id:
-                data = self.getImage(img_id)
-                record.setValue(field, data)
-                record.setValue(field + '_title', self.getImageTitle(img_id))
+                record.setValue(field + '_title', titles.get(img_id))
                 record.setValue(field + '_id', img_id)
             else:
                 record.setValue(field, None)
@@ -302,38 +349,64 @@ class CollectionModel(QSqlTableModel):
         record.append(QSqlField('image_id'))
         img_id = record.value('image')
         if img_id:
-            data = self.getPreviewImage(img_id)
-            record.setValue('image', data)
             record.setValue('image_id', img_id)
         else:
             record.setValue('image', None)
 
+        if not lazy:
+            self.loadImages(record)
+
         return record
 
+    def isLazyImage(self, record, field):
+        img_id = record.value(field + '_id')
+        if not img_id:
+            return False
+
+        value = record.value(field)
+        if isinstance(value, (QtCore.QByteArray, bytes, QImage)):
+            return False
+
+        return value == img_id
+
+    def loadImages(self, record, fields=None):
+        if fields is None:
+            fields = ImageFields + ('image',)
+
+        if record.indexOf('image_id') < 0:
+            # Record without images data
+            return
+
+        lazy_fields = [field for field in fields
+                       if self.isLazyImage(record, field)]
+
+        ids = [record.value(field) for field in lazy_fields
+               if field != 'image']
+        images = self.getImages(ids)
+
+        for field in lazy_fields:
+            img_id = record.value(field)
+            if field == 'image':
+                record.setValue(field, self.getPreviewImage(img_id))
+            else:
+                record.setValue(field, images.get(img_id))
+
     def removeRow(self, row):
+        self.clearDisplayCache()
         record = super().record(row)
+        self.__beginChange()
+        self.changedRecords.append((record, -1))
 
-        ids = []
         for field in ImageFields:
             value = record.value(field)
             if value:
-                ids.append(value)
-
-        if ids:
-            ids_sql = '(' + ','.join('?' * len(ids)) + ')'
-
-            query = QSqlQuery(self.database())
-            query.prepare("DELETE FROM photos WHERE id IN " + ids_sql)
-            for id_ in ids:
-                query.addBindValue(id_)
-            query.exec_()
+                self.photos.release(value)
+                self.imageCache.remove(('photos', value))
 
         value = record.value('image')
         if value:
-            query = QSqlQuery(self.database())
-            query.prepare("DELETE FROM images WHERE id=?")
-            query.addBindValue(value)
-            query.exec_()
+            self.previews.release(value)
+            self.imageCache.remove(('images', value))
 
         return super().removeRow(row)
 
@@ -369,12 +442,30 @@ class CollectionModel(QSqlTableModel):
                     ba = QtCore.QByteArray(image)
                     record.setValue(field.name, ba)
 
-        # Creating preview image for list
-        self._recalculateImage(record)
+        # Creating preview image for list only when source images changed
+        if not self.__isPreviewActual(record):
+            self.loadImages(record, ('obverseimg', 'reverseimg'))
+            self._recalculateImage(record)
 
         currentTime = QtCore.QDateTime.currentDateTimeUtc()
         record.setValue('updatedat', currentTime.toString("yyyy-MM-ddTHH:mm:ss.zzz"))
 
+    def __isPreviewActual(self, record):
+        if record.indexOf('image_id') < 0:
+            return False
+
+        if not self.isLazyImage(record, 'image'):
+            return False
+
+        for field in ('obverseimg', 'reverseimg'):
+            if self.isLazyImage(record, field):
+                continue
+            if record.isNull(field) and not record.value(field + '_id'):
+                continue
+            return False
+
+        return True
+
     def _recalculateImage(self, record):
         # Creating preview image for list
         if record.isNull('obverseimg') and record.isNull('reverseimg'):
@@ -418,7 +509,15 @@ class CollectionModel(QSqlTableModel):
             image.save(buffer, 'png')
             record.setValue('image', ba)
 
+    def fetchAll(self):
+        # View fetches records lazily, bulk operations need all of them
+        while self.canFetchMore():
+            self.fetchMore()
+
     def moveRows(self, row1, row2):
+        if row2 == -1:
+            self.fetchAll()
+
         if self.proxy:
             self.proxy.setDynamicSortFilter(False)
 
@@ -434,6 +533,7 @@ class CollectionModel(QSqlTableModel):
             row_rang = range(row1 + 1, row2 + 1)
 
         if row_rang:
+            self.clearDisplayCache()
             record = super().record(row1)
             old_sort_id = record.value('sort_id')
             for row in row_rang:
@@ -447,12 +547,13 @@ class CollectionModel(QSqlTableModel):
 
         self.submitAll()
 
-        if self.proxy:
+        # With SQL sorting rows stay ordered by position as required for
+        # moving
+        if self.proxy and not self.settings['sql_sorting']:
             self.sort(-1, Qt.AscendingOrder)
 
     def recalculateAllImages(self, parent=None):
-        while self.canFetchMore():
-            self.fetchMore()
+        self.fetchAll()
         rowCount = self.rowCount()
 
         if not parent:
@@ -468,25 +569,43 @@ class CollectionModel(QSqlTableModel):
             if progressDlg.wasCanceled():
                 break
 
-            record = self.record(row)
+            record = self.record(row, lazy=True)
+            self.loadImages(record, ('obverseimg', 'reverseimg'))
             self._recalculateImage(record)
             img_id = record.value('image_id')
             value = record.value('image')
             if value and img_id:
-                query = QSqlQuery(self.database())
-                query.prepare("UPDATE images SET image=? WHERE id=?")
-                query.addBindValue(record.value('image'))
-                query.addBindValue(img_id)
-                query.exec_()
+                self.imageCache.remove(('images', img_id))
+
+                # Preview could be shared with other coins, so new one
+                # stored separately
+                new_img_id = self.previews.replace(img_id, value)
+                if new_img_id != img_id:
+                    query = QSqlQuery(self.database())
+                    query.prepare("UPDATE coins SET image=? WHERE id=?")
+                    query.addBindValue(new_img_id)
+                    query.addBindValue(record.value('id'))
+                    query.exec_()
 
         progressDlg.setLabelText(self.tr("Saving..."))
 
         self.database().commit()
+        self.collection.nextRevision()
+
+        # Reload changed preview IDs
+        self.select()
 
         progressDlg.reset()
 
     def submitAll(self):
+        if self.isDirty():
+            # Cached results made before changes are updated or outdated
+            self.__beginChange()
+            self.collection.nextRevision()
+
+        self.submitting = True
         ret = super().submitAll()
+        self.submitting = False
         if not ret:
             if self.lastError().nativeErrorCode() == self.SQLITE_READONLY:
                 message = self.tr("file is readonly")
@@ -499,15 +618,65 @@ class CollectionModel(QSqlTableModel):
         if self.proxy:
             self.proxy.setDynamicSortFilter(True)
 
+        self.__reportChanges()
+
         return ret
 
     def select(self):
+        self.clearDisplayCache()
+        if self.searchSql and self.searchRevision != self.dataRevision():
+            self.__fillSearchResults()
         ret = super().select()
 
+        if self.submitting:
+            # Changes are submitted successfully, cached statistics are
+            # updated before views are refreshed
+            self.statisticsCache.apply(self.changedRecords,
+                                       self.changesRevision,
+                                       self.dataRevision())
+            self.__reportChanges()
+
         self.modelChanged.emit()
 
         return ret
 
+    def __beginChange(self):
+        if not self.changedRecords:
+            self.changesRevision = self.dataRevision()
+
+    def __reportChanges(self):
+        if self.changedRecords:
+            records = self.changedRecords
+            self.changedRecords = []
+            self.coinsChanged.emit(records)
+
+    def setSort(self, column, order):
+        self.sortColumn = column
+        self.sortOrder = order
+        super().setSort(column, order)
+
+    def orderByClause(self):
+        if self.sortColumn < 0 or self.sortColumn >= len(self.fields.fields):
+            return ''
+
+        field = self.fields.fields[self.sortColumn]
+        if field.type == Type.Status:
+            cases = ["WHEN '%s' THEN %d" % (status, order)
+                     for status, order in StatusesOrder.items() if status]
+            expr = "CASE coins.status %s ELSE 0 END" % ' '.join(cases)
+        elif field.type in (Type.String, Type.ShortString, Type.Text):
+            expr = "coins.%s COLLATE NOCASE" % field.name
+        else:
+            expr = "coins.%s" % field.name
+
+        if self.sortOrder == Qt.DescendingOrder:
+            direction = 'DESC'
+        else:
+            direction = 'ASC'
+
+        # Position makes order of equal values stable
+        return "ORDER BY %s %s, coins.sort_id ASC" % (expr, direction)
+
     def columnType(self, column):
         if isinstance(column, QtCore.QModelIndex):
             column = column.column()
@@ -521,35 +690,93 @@ class CollectionModel(QSqlTableModel):
         return self.fields.fields[column].name
 
     def getImage(self, img_id):
-        query = QSqlQuery(self.database())
-        query.prepare("SELECT image FROM photos WHERE id=?")
-        query.addBindValue(img_id)
-        query.exec_()
-        if query.first():
-            return query.record().value(0)
+        return self.__getCachedImage('photos', img_id)
 
     def getPreviewImage(self, img_id):
-        query = QSqlQuery(self.database())
-        query.prepare("SELECT image FROM images WHERE id=?")
-        query.addBindValue(img_id)
+        return self.__getCachedImage('images', img_id)
+
+    def getImages(self, ids):
+        images = {}
+        missed = []
+        for img_id in ids:
+            data = self.imageCache.get(('photos', img_id))
+            if data is not None:
+                images[img_id] = data
+            else:
+                missed.append(img_id)
+
+        for query in self.__selectByIds("SELECT id, image, hash FROM photos", missed):
+            while query.next():
+                img_id = query.record().value(0)
+                data = self.photos.imageData(query.record().value(1),
+                                             query.record().value(2))
+                if data:
+                    self.imageCache.put(('photos', img_id), data)
+                images[img_id] = data
+            query.finish()
+
+        return images
+
+    def getImageTitles(self, ids):
+        titles = {}
+        for query in self.__selectByIds("SELECT id, title FROM photos", ids):
+            while query.next():
+                titles[query.record().value(0)] = query.record().value(1)
+            query.finish()
+
+        return titles
+
+    def __selectByIds(self, sql, ids):
+        # Keep number of bound values below SQLITE_MAX_VARIABLE_NUMBER
+        chunk_size = 500
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            query = self.statements.query(
+                "%s WHERE id IN (%s)" % (sql, ','.join('?' * len(chunk))))
+            for pos, img_id in enumerate(chunk):
+                query.bindValue(pos, img_id)
+            query.exec_()
+            yield query
+
+    def __getCachedImage(self, table, img_id):
+        key = (table, img_id)
+        data = self.imageCache.get(key)
+        if data is not None:
+            return data
+
+        store = self.photos if table == 'photos' else self.previews
+        query = self.statements.query("SELECT image, hash FROM %s WHERE id=?" % table)
+        query.bindValue(0, img_id)
         query.exec_()
-        if query.first():
-            return query.record().value(0)
+        if query.next():
+            data = store.imageData(query.record().value(0),
+                                   query.record().value(1))
+            if data:
+                self.imageCache.put(key, data)
+        query.finish()
+
+        return data
 
     def getImageTitle(self, img_id):
-        query = QSqlQuery(self.database())
-        query.prepare("SELECT title FROM photos WHERE id=?")
-        query.addBindValue(img_id)
+        title = None
+
+        query = self.statements.query("SELECT title FROM photos WHERE id=?")
+        query.bindValue(0, img_id)
         query.exec_()
-        if query.first():
-            return query.record().value(0)
+        if query.next():
+            title = query.record().value(0)
+        query.finish()
+
+        return title
 
     def clearFilters(self):
         self.intFilter = ''
         self.searchFilter = ''
+        self.searchSql = ''
         self.__applyFilter()
 
     def setFilter(self, filter_):
+        # Filter could be SQL string or expression
         self.intFilter = filter_
         self.__applyFilter()
 
@@ -557,19 +784,53 @@ class CollectionModel(QSqlTableModel):
         self.extFilter = filter_
         self.__applyFilter()
 
-    def setSearchFilter(self, filter_):
-        self.searchFilter = filter_
+    def setSearchFilter(self, filter_, narrow=False):
+        self.searchSql = filter_
+        if filter_:
+            self.__fillSearchResults(narrow)
+            self.searchFilter = "id IN (SELECT id FROM temp.%s)" % self.searchTable
+        else:
+            self.searchFilter = ''
         self.__applyFilter()
 
-    def __applyFilter(self):
+    def dataRevision(self):
+        return self.collection.dataRevision()
+
+    def __fillSearchResults(self, narrow=False):
+        db = self.database()
+        sql = "CREATE TEMP TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY)" % self.searchTable
+        QSqlQuery(sql, db)
+
+        if narrow and self.searchRevision == self.dataRevision():
+            # New search text extends previous one - check only found records
+            sql = "DELETE FROM temp.%s WHERE id NOT IN"\
+                  " (SELECT id FROM coins WHERE id IN (SELECT id FROM temp.%s) AND %s)" % (
+                      self.searchTable, self.searchTable, self.searchSql)
+            QSqlQuery(sql, db)
+        else:
+            QSqlQuery("DELETE FROM temp.%s" % self.searchTable, db)
+            sql = "INSERT INTO temp.%s SELECT id FROM coins WHERE %s" % (
+                self.searchTable, self.searchSql)
+            QSqlQuery(sql, db)
+
+        self.searchRevision = self.dataRevision()
+
+    def filterExpr(self):
         filters = []
-        if self.intFilter:
-            filters.append(self.intFilter)
-        if self.extFilter:
-            filters.append(self.extFilter)
-        if self.searchFilter:
-            filters.append(self.searchFilter)
-        combinedFilter = ' AND '.join(filters)
+        for filter_ in (self.intFilter, self.extFilter, self.searchFilter):
+            if isinstance(filter_, Expr):
+                filters.append(filter_)
+            elif filter_:
+                filters.append(Raw(filter_))
+
+        return And(*filters)
+
+    def __applyFilter(self):
+        expr = self.filterExpr()
+        self.filterTables = self.valueTables.materialize(expr)
+        self.valueTables.release(self.filterTables)
+        # QSqlTableModel can't bind values of filter
+        combinedFilter = expr.toSql()
 
         # Checking for SQLITE_MAX_SQL_LENGTH (default value - 1 000 000)
         if len(combinedFilter) > 900000:
@@ -605,7 +866,7 @@ class CollectionModel(QSqlTableModel):
 
 class CollectionSettings(BaseSettings):
     Default = {
-            'Version': 7,
+            'Version': 8,
             'Type': version.AppName,
             'Password': cryptPassword(),
             'ImageSideLen': 1024,
@@ -613,7 +874,10 @@ class CollectionSettings(BaseSettings):
             'free_numeric': False,
             'convert_fraction': False,
             'store_sorting': False,
+            'sql_sorting': False,
+            'external_images': False,
             'show_tree_icons': True,
+            'show_tree_counts': False,
             'show_filter_icons': True,
             'show_list_icons': True,
             'images_at_bottom': False,
@@ -650,7 +914,9 @@ class CollectionSettings(BaseSettings):
                 elif title in ('image_height',):
                     value = float(record.value('value'))
                 elif title in ('free_numeric', 'convert_fraction',
-                               'store_sorting', 'show_tree_icons',
+                               'store_sorting', 'sql_sorting',
+                               'external_images', 'show_tree_counts',
+                               'show_tree_icons',
                                'show_filter_icons', 'show_list_icons',
                                'images_at_bottom', 'enable_bc', 'rich_text'):
                     value = record.value('value').lower() in ('true', '1')
@@ -700,18 +966,45 @@ class CollectionSettings(BaseSettings):
 
 
 class Collection(QtCore.QObject):
+    coinsChanged = pyqtSignal(list)
+    IMAGE_CACHE_SIZE = 64 * 1024 * 1024
+    # Number of values
+    FILTER_VALUES_CACHE_SIZE = 100000
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
         self.db = QSqlDatabase.addDatabase('QSQLITE')
         self._pages = None
+        self.backupThread = None
         self.fileName = None
+        self.imageCache = LruCache(self.IMAGE_CACHE_SIZE)
+        self.filterValuesCache = LruCache(self.FILTER_VALUES_CACHE_SIZE)
+        self.statisticsCache = StatisticsCache()
+        # Grows on each changing of coins, results cached for older
+        # revisions are outdated
+        self.revision = 0
+        self.statements = StatementPool(self.db)
+        self.photos = PhotoStore(self.db, self.statements, 'photos')
+        self.previews = PhotoStore(self.db, self.statements, 'images')
+        self.searchIndex = SearchIndex(self.db, self.parent())
+
+    def dataRevision(self):
+        return self.revision
+
+    def nextRevision(self):
+        self.revision += 1
 
     def isOpen(self):
         return self.db.isValid() and self.fileName
 
     def open(self, fileName):
         self.fileName = None
+        self.imageCache.clear()
+        self.filterValuesCache.clear()
+        self.statisticsCache.clear()
+        self.nextRevision()
+        self.statements.clear()
 
         file = QtCore.QFileInfo(fileName)
         if file.isFile():
@@ -763,16 +1056,28 @@ class Collection(QtCore.QObject):
             self.fileName = None
             return False
 
-        self._pages = CollectionPages(self.db)
+        self.photos.open(PhotoStore.sidecarDirectory(fileName),
+                         self.settings['external_images'])
+
+        self.indexManager = IndexManager(self.db, self.fields)
+        self._pages = CollectionPages(self.db, self.indexManager)
+        self._pages.updateIndexes()
 
         self.description = CollectionDescription(self)
 
+        self.searchIndex.open(self.fields)
+
         self.__speedup()
 
         return True
 
     def create(self, fileName):
         self.fileName = None
+        self.imageCache.clear()
+        self.filterValuesCache.clear()
+        self.statisticsCache.clear()
+        self.nextRevision()
+        self.statements.clear()
 
         if QtCore.QFileInfo(fileName).exists():
             QMessageBox.critical(self.parent(),
@@ -791,11 +1096,16 @@ class Collection(QtCore.QObject):
         self.fields = CollectionFields(self.db)
 
         self.createCoinsTable()
+        self.searchIndex.open(self.fields)
 
-        self._pages = CollectionPages(self.db)
+        self.indexManager = IndexManager(self.db, self.fields)
+        self._pages = CollectionPages(self.db, self.indexManager)
 
         self.settings = CollectionSettings(self.db)
 
+        self.photos.open(PhotoStore.sidecarDirectory(fileName),
+                         self.settings['external_images'])
+
         self.description = CollectionDescription(self)
 
         self.__speedup()
@@ -828,11 +1138,7 @@ class Collection(QtCore.QObject):
         sql = "CREATE TABLE coins (" + ", ".join(sqlFields) + ")"
         QSqlQuery(sql, self.db)
 
-        sql = "CREATE TABLE photos (id INTEGER PRIMARY KEY, title TEXT, image BLOB)"
-        QSqlQuery(sql, self.db)
-
-        sql = "CREATE TABLE images (id INTEGER PRIMARY KEY, image BLOB)"
-        QSqlQuery(sql, self.db)
+        PhotoStore.createTables(self.db)
 
     def isReferenceAttached(self):
         return ('sections' in self.db.tables())
@@ -900,11 +1206,14 @@ class Collection(QtCore.QObject):
                 refSection.fillFromQuery(query)
                 refSection.reload()
 
+        self.reference.nextRevision()
+
         progressDlg.reset()
 
     def editReference(self):
         dialog = AllReferenceDialog(self.reference, self.parent())
-        dialog.exec_()
+        if dialog.exec_() == QDialog.Accepted:
+            self.reference.nextRevision()
 
     def attachReference(self):
         result = QMessageBox.information(
@@ -1080,49 +1389,163 @@ class Collection(QtCore.QObject):
 
         return acts
 
-    @waitCursorDecorator
+    def isBackupRunning(self):
+        return self.backupThread is not None
+
     def backup(self):
-        backupDir = QtCore.QDir(Settings()['backup'])
-        if not backupDir.exists():
-            backupDir.mkpath(backupDir.absolutePath())
+        if self.isBackupRunning():
+            return False
+
+        settings = Settings()
+        store = BackupStore(settings['backup'], self.getCollectionName())
+        thread = BackupThread(store, self.fileName, settings['backup_keep'],
+                              self.photos, self)
 
-        backupFileName = backupDir.filePath("%s_%s.db" % (self.getCollectionName(), QtCore.QDateTime.currentDateTime().toString('yyMMddhhmmss')))
-        srcFile = QtCore.QFile(self.fileName)
-        if not srcFile.copy(backupFileName):
+        progressDlg = Gui.ProgressDialog(
+            self.tr("Backup collection"), self.tr("Cancel"), 0, self.parent())
+        # Snapshot and storing of chunks are reported separately
+        progressDlg.setAutoReset(False)
+        progressDlg.canceled.connect(thread.cancel)
+        thread.progress.connect(progressDlg.setProgress)
+
+        # Backup is made by worker thread while GUI is repainted by nested
+        # event loop. Dialog blocks all windows from the start, so coins
+        # can't be changed and backup can't be started again meanwhile.
+        # Changes made by other programs only restart snapshot.
+        progressDlg.setWindowModality(Qt.ApplicationModal)
+        progressDlg.setMinimumDuration(0)
+        progressDlg.show()
+
+        self.backupThread = thread
+        loop = QtCore.QEventLoop()
+        thread.finished.connect(loop.quit)
+        thread.start()
+        loop.exec_()
+        self.backupThread = None
+
+        progressDlg.reset()
+
+        if thread.canceled:
+            return False
+
+        if thread.error:
             QMessageBox.critical(self.parent(),
                             self.tr("Backup collection"),
-                            self.tr("Can't make a collection backup at %s") %
-                                                                backupFileName)
+                            self.tr("Can't make a collection backup at %s\n%s") %
+                                                (store.directory, thread.error))
             return False
 
         return True
 
+    def restore(self):
+        store = BackupStore(Settings()['backup'], self.getCollectionName())
+
+        manifests = []
+        for name in reversed(store.backups()):
+            try:
+                manifests.append((name, store.manifest(name)))
+            except (OSError, ValueError):
+                continue
+
+        if not manifests:
+            QMessageBox.information(self.parent(),
+                            self.tr("Restore collection"),
+                            self.tr("Backups of collection not found"))
+            return None
+
+        items = []
+        for _name, manifest in manifests:
+            date = QtCore.QDateTime.fromString(manifest['created'],
+                                               Qt.ISODate)
+            items.append(self.tr("%s (%d coins)") % (
+                date.toString(Qt.SystemLocaleShortDate), manifest['coins']))
+
+        item, ok = QInputDialog.getItem(self.parent(),
+                                        self.tr("Restore collection"),
+                                        self.tr("Backup"), items, 0, False)
+        if not ok:
+            return None
+        name = manifests[items.index(item)][0]
+
+        fileName, _selectedFilter = Gui.getSaveFileName(
+            self.parent(), 'restore_collection',
+            "%s_%s.db" % (self.getCollectionName(), name),
+            os.path.dirname(self.fileName), self.tr("Collections (*.db)"))
+        if not fileName:
+            return None
+
+        if os.path.abspath(fileName) == os.path.abspath(self.fileName):
+            QMessageBox.critical(self.parent(),
+                            self.tr("Restore collection"),
+                            self.tr("Can't restore backup over opened collection"))
+            return None
+
+        progressDlg = Gui.ProgressDialog(
+            self.tr("Restore collection"), self.tr("Cancel"), 0, self.parent())
+
+        def progress(done, total):
+            progressDlg.setProgress(done, total)
+            return not progressDlg.wasCanceled()
+
+        try:
+            store.restore(name, fileName, progress)
+
+            images = PhotoStore(None, None, 'photos')
+            images.open(store.imagesDirectory)
+            if not images.backup(PhotoStore.sidecarDirectory(fileName)):
+                raise OSError(store.imagesDirectory)
+        except BackupCanceled:
+            progressDlg.reset()
+            return None
+        except (OSError, ValueError, KeyError, sqlite3.Error) as error:
+            progressDlg.reset()
+            QMessageBox.critical(self.parent(),
+                            self.tr("Restore collection"),
+                            self.tr("Can't restore collection backup\n%s") %
+                                                                    error)
+            return None
+
+        progressDlg.reset()
+
+        return fileName
+
     def isNeedBackup(self):
         settings = Settings()
         autobackup_depth = settings['autobackup_depth']
-        filter_ = ('%s_????????????.db' % self.getCollectionName(),)
-        files = QtCore.QDirIterator(settings['backup'], filter_, QtCore.QDir.Files)
-        while files.hasNext():
-            file = files.next()
-            file_info = QtCore.QFileInfo(file)
-            if file_info.completeSuffix() == 'db':
-                file_title = file_info.baseName()
-                file_date = file_title[-12:-6]
 
-                query = QSqlQuery(self.db)
-                query.prepare("SELECT count(*) FROM coins WHERE updatedat > ?")
-                date = "20%s-%s-%sT23:59:59" % (file_date[0:2], file_date[2:4], file_date[4:6])
-                query.addBindValue(date)
-                query.exec_()
-                query.first()
-                if query.record().value(0) < autobackup_depth:
-                    return False
+        store = BackupStore(settings['backup'], self.getCollectionName())
+        manifest = store.latest()
+        if manifest:
+            date = manifest['updatedat'] or ''
+        else:
+            # Backups made by whole file copying
+            latest = None
+            filter_ = ('%s_????????????.db' % self.getCollectionName(),)
+            files = QtCore.QDirIterator(settings['backup'], filter_, QtCore.QDir.Files)
+            while files.hasNext():
+                file_info = QtCore.QFileInfo(files.next())
+                if file_info.completeSuffix() == 'db':
+                    file_date = file_info.baseName()[-12:-6]
+                    if latest is None or file_date > latest:
+                        latest = file_date
+
+            if latest is None:
+                return True
+
+            date = "20%s-%s-%sT23:59:59" % (latest[0:2], latest[2:4], latest[4:6])
 
-        return True
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT count(*) FROM coins WHERE updatedat > ?")
+        query.addBindValue(date)
+        query.exec_()
+        query.first()
+
+        return query.record().value(0) >= autobackup_depth
 
     @waitCursorDecorator
     def vacuum(self):
         QSqlQuery("VACUUM", self.db)
+        self.photos.collectGarbage()
 
     @staticmethod
     def fileNameToCollectionName(fileName):
@@ -1192,8 +1615,7 @@ class Collection(QtCore.QObject):
         QSqlQuery(sql, db)
 
         model = self.model()
-        while model.canFetchMore():
-            model.fetchMore()
+        model.fetchAll()
 
         dest_model = QSqlTableModel(self.parent(), db)
         dest_model.setEditStrategy(QSqlTableModel.OnManualSubmit)
@@ -1224,10 +1646,12 @@ class Collection(QtCore.QObject):
             if progressDlg.wasCanceled():
                 break
 
-            coin = model.record(i)
+            coin = model.record(i, lazy=True)
             if coin.value('status') in ('pass', 'sold'):
                 continue
 
+            model.loadImages(coin, ('obverseimg', 'reverseimg'))
+
             dest_record = dest_model.record()
 
             for field in fields:
@@ -1411,162 +1835,52 @@ WHERE coins.id in (select t3.id from coins t3 join (select id, image from photos
             if result == QDialog.Rejected:
                 return
 
-        query = QSqlQuery("SELECT COUNT(*) FROM src.coins", self.db)
-        query.first()
-        count = query.record().value(0)
+        inserted_count = 0
+        updated_count = 0
 
-        progressDlg = Gui.ProgressDialog(
-            self.tr("Synchronizing"), self.tr("Cancel"), count, self.parent())
+        merge = Merge(self.db)
+        merge.prepare()
 
-        fields_query = QSqlQuery("PRAGMA table_info(coins)", self.db)
-        fields_query.exec_()
-        fields = []
-        while fields_query.next():
-            fields.append(fields_query.record().value(1))
-        fields.remove('id')
-        sql_fields = ','.join(fields)
+        progressDlg = Gui.ProgressDialog(
+            self.tr("Synchronizing"), self.tr("Cancel"), len(merge.chunks),
+            self.parent())
 
-        inserted_count = 0
-        updated_count = 0
-        query = QSqlQuery("SELECT DISTINCT createdat FROM src.coins", self.db)
-        while query.next():
+        for first, last in merge.chunks:
             progressDlg.step()
-            if progressDlg.wasCanceled():
+            if progressDlg.wasCanceled() or merge.error:
                 break
 
+            # Every chunk is committed, so canceling keeps merged coins
             self.db.transaction()
-
-            sql = "SELECT 1 FROM coins WHERE createdat=? LIMIT 1"
-            select_query = QSqlQuery(sql, self.db)
-            select_query.addBindValue(query.record().value(0))
-            select_query.exec_()
-            if select_query.first():
-                dst_fields = ImageFields + \
-                             ('id', 'image', 'sort_id')
-                sql_dst_fields = ','.join(['coins.%s AS coins_%s' % (f, f) for f in dst_fields])
-                sql_src_fields = ','.join(['src_coins.%s' % f for f in fields])
-                sql = "SELECT %s, %s FROM coins\
-                    INNER JOIN src.coins src_coins ON coins.id=src_coins.id\
-                    WHERE src_coins.createdat=? AND\
-                          src_coins.createdat=coins.createdat AND\
-                          src_coins.updatedat>coins.updatedat" % (sql_src_fields, sql_dst_fields)
-                sel_query = QSqlQuery(sql, self.db)
-                sel_query.addBindValue(query.record().value(0))
-                sel_query.exec_()
-                if sel_query.first():
-                    sql = "UPDATE coins SET %s WHERE id=?" % ','.join(['%s=?' % f for f in fields])
-                    up_query = QSqlQuery(sql, self.db)
-                    for field in fields:
-                        if field == 'image':
-                            img_id = sel_query.record().value(field)
-                            old_img_id = sel_query.record().value('coins_image')
-                            if img_id and old_img_id:
-                                sql = "UPDATE images SET image=(SELECT image FROM src.images WHERE id=?) WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(img_id)
-                                img_query.addBindValue(old_img_id)
-                                img_query.exec_()
-                            elif img_id:
-                                sql = "INSERT INTO images (image) SELECT image FROM src.images WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(img_id)
-                                img_query.exec_()
-                                img_id = img_query.lastInsertId()
-                            elif old_img_id:
-                                sql = "DELETE FROM images WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(old_img_id)
-                                img_query.exec_()
-                                img_id = None
-
-                            up_query.addBindValue(img_id)
-                        elif field in ImageFields:
-                            img_id = sel_query.record().value(field)
-                            old_img_id = sel_query.record().value('coins_%s' % field)
-                            if img_id and old_img_id:
-                                sql = "UPDATE photos SET title=(SELECT title FROM src.photos WHERE id=?), image=(SELECT image FROM src.photos WHERE id=?) WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(img_id)
-                                img_query.addBindValue(img_id)
-                                img_query.addBindValue(old_img_id)
-                                img_query.exec_()
-                                img_id = old_img_id
-                            elif img_id:
-                                sql = "INSERT INTO photos (title, image) SELECT title, image FROM src.photos WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(img_id)
-                                img_query.exec_()
-                                img_id = img_query.lastInsertId()
-                            elif old_img_id:
-                                sql = "DELETE FROM photos WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(old_img_id)
-                                img_query.exec_()
-                                img_id = None
-
-                            up_query.addBindValue(img_id)
-                        elif field == 'sort_id':
-                            up_query.addBindValue(sel_query.record().value('coins_sort_id'))
-                        else:
-                            up_query.addBindValue(sel_query.record().value(field))
-                    up_query.addBindValue(sel_query.record().value('coins_id'))
-
-                    up_query.exec_()
-                    updated_count += 1
+            merge.mergeChunk(first, last)
+            if merge.error:
+                self.db.rollback()
             else:
-                sql = "SELECT %s FROM src.coins WHERE createdat=?" % sql_fields
-                sel_query = QSqlQuery(sql, self.db)
-                sel_query.addBindValue(query.record().value(0))
-                sel_query.exec_()
-                while sel_query.next():
-                    sql = "INSERT INTO coins (%s) VALUES (%s)" % (sql_fields, ','.join(['?'] * len(fields)))
-                    ins_query = QSqlQuery(sql, self.db)
-                    for field in fields:
-                        if field == 'image':
-                            old_img_id = sel_query.record().value(field)
-                            if old_img_id:
-                                sql = "INSERT INTO images (image) SELECT image FROM src.images WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(old_img_id)
-                                img_query.exec_()
-
-                                img_id = img_query.lastInsertId()
-                            else:
-                                img_id = None
-                            ins_query.addBindValue(img_id)
-                        elif field in ImageFields:
-                            old_img_id = sel_query.record().value(field)
-                            if old_img_id:
-                                sql = "INSERT INTO photos (title, image) SELECT title, image FROM src.photos WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(old_img_id)
-                                img_query.exec_()
-
-                                img_id = img_query.lastInsertId()
-                            else:
-                                img_id = None
-                            ins_query.addBindValue(img_id)
-                        elif field == 'sort_id':
-                            sort_query = QSqlQuery("SELECT MAX(sort_id) FROM coins", self.db)
-                            sort_query.first()
-                            sort_id = sort_query.record().value(0)
-                            if not sort_id:
-                                sort_id = 0
-                            ins_query.addBindValue(sort_id + 1)
-                        else:
-                            ins_query.addBindValue(sel_query.record().value(field))
+                self.db.commit()
+                inserted_count = merge.inserted
+                updated_count = merge.updated
+
+        merge.finish()
+        self.nextRevision()
 
-                    ins_query.exec_()
-                    inserted_count += 1
+        srcPhotos = PhotoStore(self.db, None, 'photos')
+        srcPhotos.open(PhotoStore.sidecarDirectory(fileName))
+        self.photos.importFiles(srcPhotos)
 
-            self.db.commit()
+        # Images could be updated in place
+        self.imageCache.clear()
 
         query = QSqlQuery("DETACH src", self.db)
         query.exec_()
 
         progressDlg.reset()
 
-        if inserted_count or updated_count:
+        if merge.error:
+            QMessageBox.critical(self.parent(),
+                                 self.tr("Synchronizing"),
+                                 self.tr("Can't synchronize collections:\n%s") %
+                                 merge.error)
+        elif inserted_count or updated_count:
             text = self.tr("Inserted %d coins, updated %d coins.\nThe application will need to restart now.") % (inserted_count, updated_count)
             QMessageBox.information(self.parent(), self.tr("Synchronizing"),
                                     text)
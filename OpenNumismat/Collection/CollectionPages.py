@@ -37,10 +37,11 @@ class CollectionPageParam(QtCore.QObject):
 
 
 class CollectionPages(QtCore.QObject):
-    def __init__(self, db, parent=None):
+    def __init__(self, db, indexManager, parent=None):
         super().__init__(parent)
 
         self.db = db
+        self.indexManager = indexManager
         sql = "CREATE TABLE IF NOT EXISTS pages (\
             id INTEGER PRIMARY KEY,\
             title TEXT,\
@@ -69,7 +70,11 @@ class CollectionPages(QtCore.QObject):
 
         query = QSqlQuery("SELECT * FROM pages WHERE id=last_insert_rowid()",
                           self.db)
-        return self.__queryToParam(query)[0]  # get only one item
+        param = self.__queryToParam(query)[0]  # get only one item
+
+        self.updateIndexes()
+
+        return param
 
     def renamePage(self, page, title):
         query = QSqlQuery(self.db)
@@ -85,6 +90,8 @@ class CollectionPages(QtCore.QObject):
         query.addBindValue(page.id)
         query.exec_()
 
+        self.updateIndexes()
+
     def openPage(self, page):
         query = QSqlQuery(self.db)
         query.prepare("UPDATE pages SET isopen=? WHERE id=?")
@@ -92,6 +99,8 @@ class CollectionPages(QtCore.QObject):
         query.addBindValue(page.id)
         query.exec_()
 
+        self.updateIndexes()
+
     def removePage(self, page):
         page.listParam.remove()
         page.treeParam.remove()
@@ -102,6 +111,8 @@ class CollectionPages(QtCore.QObject):
         query.addBindValue(page.id)
         query.exec_()
 
+        self.updateIndexes()
+
     def savePositions(self, pages):
         for position, page in enumerate(pages):
             query = QSqlQuery(self.db)
@@ -131,12 +142,18 @@ class CollectionPages(QtCore.QObject):
         query.addBindValue(page.id)
         query.exec_()
 
+        self.updateIndexes()
+
+    def updateIndexes(self):
+        self.indexManager.update()
+
     def __queryToParam(self, query):
         pagesParam = []
         while query.next():
             param = CollectionPageParam(query.record())
             param.fields = self.fields
             param.db = self.db
+            param.indexManager = self.indexManager
             # TODO: Improve code
             if param.type == CollectionPageTypes.List:
                 param.listParam = ListPageParam(param)
@@ -0,0 +1,242 @@
+from PyQt5.QtSql import QSqlQuery
+
+
+def quote(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+
+    return "'%s'" % str(value).replace("'", "''")
+
+
+def valueText(value):
+    if value is None:
+        return ''
+
+    return str(value)
+
+
+class Expr:
+    """Node of filter expression tree.
+
+    Expression is compiled to SQL with placeholders and list of bound
+    values, so statements of same shape are prepared once. Values are
+    compared as text, like filters of tree and column headers do.
+    """
+
+    def compile(self, tables=True):
+        """tables=False makes SQL for connection without temporary tables
+        of values"""
+        params = []
+        sql = self._build(params, tables)
+        return sql, params
+
+    def toSql(self):
+        # For API which can't bind values (QSqlTableModel.setFilter)
+        return self._build(None, True)
+
+    def matches(self, values):
+        """Checks record values (dict by field name), unknown fields match"""
+        raise NotImplementedError
+
+    def isEmpty(self):
+        return False
+
+    def walk(self):
+        yield self
+
+    def _build(self, params, tables):
+        raise NotImplementedError
+
+    @staticmethod
+    def _value(value, params):
+        if params is None:
+            return quote(value)
+
+        params.append(value)
+        return '?'
+
+
+class Raw(Expr):
+    """Plain SQL condition, it can't be checked in memory"""
+
+    def __init__(self, sql):
+        self.sql = sql
+
+    def matches(self, values):
+        return True
+
+    def isEmpty(self):
+        return not self.sql
+
+    def _build(self, params, tables):
+        return '(%s)' % self.sql
+
+
+class Eq(Expr):
+    def __init__(self, field, value, negate=False):
+        self.field = field
+        self.value = value
+        self.negate = negate
+
+    def matches(self, values):
+        if self.field not in values:
+            return True
+
+        equal = (valueText(values[self.field]) == valueText(self.value))
+        return equal != self.negate
+
+    def _build(self, params, tables):
+        operator = '<>' if self.negate else '='
+        return "%s%s%s" % (self.field, operator,
+                           self._value(self.value, params))
+
+
+class In(Expr):
+    def __init__(self, field, values, negate=False):
+        self.field = field
+        self.values = list(values)
+        self.negate = negate
+        # Temporary table with values, assigned by ValueTables
+        self.table = None
+
+    def matches(self, values):
+        if self.field not in values:
+            return True
+
+        found = valueText(values[self.field]) in \
+            set(valueText(value) for value in self.values)
+        return found != self.negate
+
+    def _build(self, params, tables):
+        operator = 'NOT IN' if self.negate else 'IN'
+        if self.table and tables:
+            return "%s %s (SELECT value FROM temp.%s)" % (
+                self.field, operator, self.table)
+
+        items = ','.join(self._value(value, params) for value in self.values)
+        return "%s %s (%s)" % (self.field, operator, items)
+
+
+class Blank(Expr):
+    """NULL or empty value"""
+
+    def __init__(self, field, negate=False):
+        self.field = field
+        self.negate = negate
+
+    def matches(self, values):
+        if self.field not in values:
+            return True
+
+        return (valueText(values[self.field]) == '') != self.negate
+
+    def _build(self, params, tables):
+        operator = '<>' if self.negate else '='
+        return "ifnull(%s,'')%s''" % (self.field, operator)
+
+
+class IsNull(Expr):
+    def __init__(self, field):
+        self.field = field
+
+    def matches(self, values):
+        if self.field not in values:
+            return True
+
+        return values[self.field] is None
+
+    def _build(self, params, tables):
+        return "%s IS NULL" % self.field
+
+
+class And(Expr):
+    OPERATOR = ' AND '
+
+    def __init__(self, *exprs):
+        # Empty parts are skipped, so filters could be combined as is
+        self.exprs = [expr for expr in exprs
+                      if expr is not None and not expr.isEmpty()]
+
+    def matches(self, values):
+        return all(expr.matches(values) for expr in self.exprs)
+
+    def isEmpty(self):
+        return not self.exprs
+
+    def walk(self):
+        yield self
+        for expr in self.exprs:
+            yield from expr.walk()
+
+    def _build(self, params, tables):
+        if not self.exprs:
+            return ''
+        if len(self.exprs) == 1:
+            return self.exprs[0]._build(params, tables)
+
+        return '(%s)' % self.OPERATOR.join(
+            expr._build(params, tables) for expr in self.exprs)
+
+
+class Or(And):
+    OPERATOR = ' OR '
+
+    def matches(self, values):
+        return any(expr.matches(values) for expr in self.exprs)
+
+
+class ValueTables:
+    """Temporary tables with values of large IN lists.
+
+    Each set of values is inserted once into indexed table and expression
+    refers to it by subquery, so length of filter and statement doesn't
+    depend on number of values.
+    """
+    MIN_SIZE = 100
+
+    def __init__(self, db, prefix):
+        self.db = db
+        self.prefix = prefix
+        self._tables = {}
+        self._counter = 0
+
+    def materialize(self, expr):
+        """Moves large lists of expr to tables, returns names of used tables"""
+        used = set()
+        for node in expr.walk():
+            if isinstance(node, In) and len(node.values) >= self.MIN_SIZE:
+                node.table = self.__table(node.values)
+                used.add(node.table)
+
+        return used
+
+    def release(self, used):
+        for key, table in list(self._tables.items()):
+            if table not in used:
+                QSqlQuery("DROP TABLE IF EXISTS temp.%s" % table, self.db)
+                del self._tables[key]
+
+    def __table(self, values):
+        key = frozenset(values)
+        table = self._tables.get(key)
+        if table:
+            return table
+
+        self._counter += 1
+        table = '%s%d' % (self.prefix, self._counter)
+        # Column without type keeps affinity of compared column, like
+        # literals of IN list
+        QSqlQuery("CREATE TEMP TABLE %s (value PRIMARY KEY)" % table, self.db)
+
+        query = QSqlQuery(self.db)
+        query.prepare("INSERT OR IGNORE INTO temp.%s VALUES (?)" % table)
+        for value in key:
+            query.bindValue(0, value)
+            query.exec_()
+
+        self._tables[key] = table
+        return table
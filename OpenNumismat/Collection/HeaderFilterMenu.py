@@ -1,10 +1,10 @@
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
-from PyQt5.QtSql import QSqlQuery
 from PyQt5.QtWidgets import *
 
 from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
 from OpenNumismat.Collection.CollectionFields import Statuses, StatusesOrder
+from OpenNumismat.Collection.FilterExpr import And, Or, Eq, In, Blank, IsNull
 from OpenNumismat.Tools.Gui import statusIcon
 from OpenNumismat.Tools.Converters import numberWithFraction
 
@@ -78,18 +78,13 @@ class FilterMenuButton(QPushButton):
         hasBlanks = False
         columnType = self.model.columnType(self.fieldid)
         if self.model.columnName(self.fieldid) == 'year':
-            filtersSql = self.filtersToSql(filters.values())
-            if filtersSql:
-                filtersSql = 'WHERE ' + filtersSql
-            sql = "SELECT DISTINCT %s FROM coins %s" % (self.columnName, filtersSql)
-            query = QSqlQuery(sql, self.db)
+            values = self.__values("SELECT DISTINCT %s FROM coins" % self.columnName,
+                                   self.filtersExpr(filters.values()))
 
-            while query.next():
-                icon = None
-                if query.record().isNull(0):
+            for orig_data in values:
+                if orig_data is None:
                     data = None
                 else:
-                    orig_data = query.record().value(0)
                     data = str(orig_data)
                     label = data
                     try:
@@ -121,24 +116,19 @@ class FilterMenuButton(QPushButton):
 
             self.listWidget.sortItems()
         elif columnType == Type.Text or columnType in Type.ImageTypes:
-            dataFilter = BlankFilter(self.columnName).toSql()
-            blanksFilter = DataFilter(self.columnName).toSql()
+            dataFilter = BlankFilter(self.columnName).expr()
+            blanksFilter = DataFilter(self.columnName).expr()
 
-            filtersSql = self.filtersToSql(filters.values())
-            sql = "SELECT 1 FROM coins WHERE " + filtersSql
-            if filtersSql:
-                sql += ' AND '
+            filtersExpr = self.filtersExpr(filters.values())
 
             # Get blank row count
-            blank_sql = sql + blanksFilter + " LIMIT 1"
-            query = QSqlQuery(blank_sql, self.db)
-            if query.first():
+            if self.__values("SELECT 1 FROM coins",
+                             And(filtersExpr, blanksFilter), " LIMIT 1"):
                 hasBlanks = True
 
             # Get not blank row count
-            not_blank_sql = sql + dataFilter + " LIMIT 1"
-            query = QSqlQuery(not_blank_sql, self.db)
-            if query.first():
+            if self.__values("SELECT 1 FROM coins",
+                             And(filtersExpr, dataFilter), " LIMIT 1"):
                 if columnType in Type.ImageTypes:
                     label = self.tr("(Images)")
                 elif columnType == Type.Text:
@@ -153,15 +143,11 @@ class FilterMenuButton(QPushButton):
                     item.setCheckState(Qt.Unchecked)
                 self.listWidget.addItem(item)
         elif columnType == Type.Status:
-            filtersSql = self.filtersToSql(filters.values())
-            if filtersSql:
-                filtersSql = 'WHERE ' + filtersSql
-            sql = "SELECT DISTINCT %s FROM coins %s ORDER BY %s ASC" % (
-                self.columnName, filtersSql, self.columnName)
-            query = QSqlQuery(sql, self.db)
+            values = self.__values("SELECT DISTINCT %s FROM coins" % self.columnName,
+                                   self.filtersExpr(filters.values()),
+                                   " ORDER BY %s ASC" % self.columnName)
 
-            while query.next():
-                value = query.record().value(0)
+            for value in values:
                 label = Statuses[value]
 
                 item = StatusSortListWidgetItem(label)
@@ -185,18 +171,13 @@ class FilterMenuButton(QPushButton):
 
             self.listWidget.sortItems()
         elif columnType == Type.Denomination:
-            filtersSql = self.filtersToSql(filters.values())
-            if filtersSql:
-                filtersSql = 'WHERE ' + filtersSql
-            sql = "SELECT DISTINCT %s FROM coins %s" % (self.columnName, filtersSql)
-            query = QSqlQuery(sql, self.db)
+            values = self.__values("SELECT DISTINCT %s FROM coins" % self.columnName,
+                                   self.filtersExpr(filters.values()))
 
-            while query.next():
-                icon = None
-                if query.record().isNull(0):
+            for orig_data in values:
+                if orig_data is None:
                     data = None
                 else:
-                    orig_data = query.record().value(0)
                     data = str(orig_data)
                     label, _ = numberWithFraction(data, self.settings['convert_fraction'])
 
@@ -222,21 +203,15 @@ class FilterMenuButton(QPushButton):
 
             self.listWidget.sortItems()
         else:
-            filtersSql = self.filtersToSql(filters.values())
-            if filtersSql:
-                filtersSql = 'WHERE ' + filtersSql
-            sql = "SELECT DISTINCT %s FROM coins %s" % (self.columnName, filtersSql)
-            query = QSqlQuery(sql, self.db)
+            values = self.__values("SELECT DISTINCT %s FROM coins" % self.columnName,
+                                   self.filtersExpr(filters.values()),
+                                   icons=True)
 
-            while query.next():
-                icon = None
-                if query.record().isNull(0):
+            for orig_data, icon in values:
+                if orig_data is None:
                     data = None
                 else:
-                    orig_data = query.record().value(0)
                     data = str(orig_data)
-                    if self.settings['show_filter_icons']:
-                        icon = self.reference.getIcon(self.columnName, data)
 
                 if not data:
                     hasBlanks = True
@@ -390,8 +365,7 @@ class FilterMenuButton(QPushButton):
             if self.fieldid in self.filters.keys():
                 self.filters.pop(self.fieldid)
 
-        filtersSql = self.filtersToSql(self.filters.values())
-        self.model.setFilter(filtersSql)
+        self.model.setFilter(self.filtersExpr(self.filters.values()))
 
         self.listParam.save_filters()
 
@@ -406,13 +380,51 @@ class FilterMenuButton(QPushButton):
             else:
                 item.setHidden(True)
 
-    @staticmethod
-    def filtersToSql(filters):
-        sqlFilters = []
-        for columnFilters in filters:
-            sqlFilters.append(columnFilters.toSql())
+    def __values(self, sql, expr, tail='', icons=False):
+        # Values are cached until collection (and reference for icons) is
+        # changed, so reopening menu doesn't query database
+        showIcons = icons and self.settings['show_filter_icons']
+        # Values of large lists are keyed as bound values, not as literals
+        where, params = expr.compile(tables=False)
+        key = [sql + tail, where, tuple(params), self.model.dataRevision(),
+               icons]
+        if showIcons:
+            key.append(self.reference.dataRevision())
+        key = tuple(key)
+
+        values = self.model.filterValuesCache.get(key)
+        if values is None:
+            values = []
+            tables = self.model.valueTables.materialize(expr)
+            query = self.__select(sql, expr, tail)
+            while query.next():
+                record = query.record()
+                value = None if record.isNull(0) else record.value(0)
+                if icons:
+                    icon = None
+                    if showIcons and value is not None:
+                        icon = self.reference.getIcon(self.columnName,
+                                                      str(value))
+                    values.append((value, icon))
+                else:
+                    values.append(value)
+            query.finish()
+            # Tables used by filter of model are kept
+            self.model.valueTables.release(tables | self.model.filterTables)
+
+            self.model.filterValuesCache.put(key, values)
+
+        return values
 
-        return ' AND '.join(sqlFilters)
+    def __select(self, sql, expr, tail=''):
+        where, params = expr.compile()
+        if where:
+            sql += " WHERE " + where
+        return self.model.statements.exec_(sql + tail, params)
+
+    @staticmethod
+    def filtersExpr(filters):
+        return And(*[columnFilters.expr() for columnFilters in filters])
 
 
 class BaseFilter:
@@ -421,9 +433,12 @@ class BaseFilter:
         self.value = None
         self.revert = False
 
-    def toSql(self):
+    def expr(self):
         raise NotImplementedError
 
+    def toSql(self):
+        return self.expr().toSql()
+
     def isBlank(self):
         return False
 
@@ -440,35 +455,31 @@ class ValueFilter(BaseFilter):
 
         self.value = value
 
-    # TODO: Deprecated method
-    def toSql(self):
-        if self.revert:
-            return "%s='%s'" % (self.name, self.value.replace("'", "''"))
-        else:
-            return "%s<>'%s'" % (self.name, self.value.replace("'", "''"))
+    def expr(self):
+        return Eq(self.name, self.value, negate=not self.revert)
 
 
 class DataFilter(BaseFilter):
-    def toSql(self):
+    def expr(self):
         if self.revert:
             # Filter out blank values
-            return "ifnull(%s,'')<>''" % self.name
+            return Blank(self.name, negate=True)
         else:
             # Filter out not null and not empty values
-            return "ifnull(%s,'')=''" % self.name
+            return Blank(self.name)
 
     def isData(self):
         return True
 
 
 class BlankFilter(BaseFilter):
-    def toSql(self):
+    def expr(self):
         if self.revert:
             # Filter out not null and not empty values
-            return "ifnull(%s,'')=''" % self.name
+            return Blank(self.name)
         else:
             # Filter out blank values
-            return "ifnull(%s,'')<>''" % self.name
+            return Blank(self.name, negate=True)
 
     def isBlank(self):
         return True
@@ -502,37 +513,34 @@ class ColumnFilters:
     def hasRevert(self):
         return self._revert
 
-    def toSql(self):
-        values = []
-        for filter_ in self._valueFilters():
-            sql = "'%s'" % filter_.value.replace("'", "''")
-            values.append(sql)
+    def expr(self):
+        values = [filter_.value for filter_ in self._valueFilters()]
 
-        combinedFilters = ''
+        combinedFilters = None
         if values:
-            sqlValueFilters = ','.join(values)
-            if self.hasRevert():
-                combinedFilters = "%s IN (%s)" % (self.name, sqlValueFilters)
-            else:
-                combinedFilters = "%s NOT IN (%s)" % (self.name, sqlValueFilters)
+            combinedFilters = In(self.name, values,
+                                 negate=not self.hasRevert())
 
         if self.hasBlank():
             if combinedFilters:
                 if self.hasRevert():
-                    combinedFilters = combinedFilters + ' OR ' + self._blank.toSql()
+                    combinedFilters = Or(combinedFilters, self._blank.expr())
                 else:
-                    combinedFilters = combinedFilters + ' AND ' + self._blank.toSql()
+                    combinedFilters = And(combinedFilters, self._blank.expr())
             else:
-                combinedFilters = self._blank.toSql()
+                combinedFilters = self._blank.expr()
         elif self.hasData():
             # Data filter can't contain any additional value filters
-            combinedFilters = self._data.toSql()
+            combinedFilters = self._data.expr()
 
         # Note: In SQLite SELECT * FROM coins WHERE title NOT IN ('value') also
         # filter out a NULL values. Work around this problem
         if not self.hasBlank() and not self.hasRevert():
-            combinedFilters = combinedFilters + (' OR %s IS NULL' % self.name)
-        return '(' + combinedFilters + ')'
+            combinedFilters = Or(combinedFilters, IsNull(self.name))
+        return combinedFilters
+
+    def toSql(self):
+        return self.expr().toSql()
 
     def _valueFilters(self):
         for filter_ in self._filters:
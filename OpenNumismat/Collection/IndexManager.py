@@ -0,0 +1,151 @@
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
+from OpenNumismat.Collection.CollectionPages import CollectionPageTypes
+from OpenNumismat.Collection.TreeParam import TreeParam
+
+
+class IndexManager:
+    """Maintains indexes on coins columns used by opened pages"""
+    PREFIX = 'coins_auto_'
+    # Used by backup checking and merging
+    PERMANENT_FIELDS = ('createdat', 'updatedat')
+
+    def __init__(self, db, fields):
+        self.db = db
+        self.fields = fields
+        # Indexed columns known after last update
+        self.indexed = None
+
+    @classmethod
+    def createSql(cls, name):
+        return "CREATE INDEX IF NOT EXISTS %s%s ON coins(%s)" % (
+            cls.PREFIX, name, name)
+
+    def update(self):
+        names = set(self.PERMANENT_FIELDS)
+        if 'pages' in self.db.tables():
+            names.update(self.__treeFields())
+            names.update(self.__filterFields())
+            names.update(self.__statisticsFields())
+
+        columns = set(field.name for field in self.fields.fields
+                      if field.type not in Type.ImageTypes)
+        names &= columns
+
+        if self.indexed is None:
+            self.indexed = self.indexedFields()
+        existing = self.indexed
+        if names == existing:
+            return
+
+        self.db.transaction()
+
+        for name in existing - names:
+            QSqlQuery("DROP INDEX IF EXISTS %s%s" % (self.PREFIX, name),
+                      self.db)
+        for name in names - existing:
+            QSqlQuery(self.createSql(name), self.db)
+
+        self.db.commit()
+
+        self.indexed = names
+
+    def indexedFields(self):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT name FROM sqlite_master WHERE type='index'"
+                      " AND tbl_name='coins' AND name LIKE ?")
+        query.addBindValue(self.PREFIX + '%')
+        query.exec_()
+
+        names = set()
+        while query.next():
+            names.add(query.record().value(0)[len(self.PREFIX):])
+
+        return names
+
+    def __fieldName(self, field_id):
+        if isinstance(field_id, int) and 0 <= field_id < len(self.fields.fields):
+            return self.fields.field(field_id).name
+
+        return None
+
+    def __openedPages(self, info_type=None):
+        query = QSqlQuery("SELECT id, type FROM pages WHERE isopen", self.db)
+        pages = []
+        while query.next():
+            record = query.record()
+            type_ = record.value('type') & CollectionPageTypes.InfoTypeMask
+            if info_type is None or type_ == info_type:
+                pages.append(record.value('id'))
+
+        return pages
+
+    def __treeFields(self):
+        names = set()
+
+        pages = self.__openedPages()
+        customized_pages = set()
+        if 'treeparam' in self.db.tables():
+            query = QSqlQuery("SELECT pageid, fieldid FROM treeparam", self.db)
+            while query.next():
+                record = query.record()
+                page_id = record.value('pageid')
+                if page_id in pages:
+                    names.add(self.__fieldName(record.value('fieldid')))
+                    customized_pages.add(page_id)
+
+        # Pages without stored parameters use default tree
+        if len(customized_pages) < len(pages):
+            for param in TreeParam.DefaultParams:
+                names.update(param)
+
+        return names
+
+    def __filterFields(self):
+        names = set()
+
+        if 'filters' in self.db.tables():
+            pages = self.__openedPages()
+            query = QSqlQuery("SELECT DISTINCT pageid, fieldid FROM filters",
+                              self.db)
+            while query.next():
+                record = query.record()
+                if record.value('pageid') in pages:
+                    names.add(self.__fieldName(record.value('fieldid')))
+
+        return names
+
+    def __statisticsFields(self):
+        names = set()
+
+        if 'statistics' in self.db.tables():
+            pages = self.__openedPages(CollectionPageTypes.Statistics)
+            query = QSqlQuery("SELECT * FROM statistics", self.db)
+            while query.next():
+                record = query.record()
+                if record.value('pageid') not in pages:
+                    continue
+
+                chart = record.value('chart')
+                if chart == 'geochart':
+                    names.add('country')
+                elif chart == 'progress':
+                    names.add('status')
+                    if record.value('items') == 'created':
+                        names.add('createdat')
+                    else:
+                        names.add('paydate')
+                else:
+                    field_names = [self.__fieldName(record.value('fieldid'))]
+                    if chart == 'stacked':
+                        field_names.append(self.__fieldName(record.value('subfieldid')))
+
+                    for name in field_names:
+                        names.add(name)
+                        if name == 'fineness':
+                            names.add('material')
+                        elif name == 'unit':
+                            names.add('value')
+
+        return names
@@ -29,6 +29,7 @@ class ListPageParam(QtCore.QObject):
         self.__lists_changed = False
         self.page = page
         self.db = page.db
+        self.indexManager = page.indexManager
 
         if 'lists' not in self.db.tables():
             sql = """CREATE TABLE lists (
@@ -171,6 +172,8 @@ class ListPageParam(QtCore.QObject):
 
         self.db.commit()
 
+        self.indexManager.update()
+
     def remove(self):
         self.__remove_lists()
         self.__remove_filters()
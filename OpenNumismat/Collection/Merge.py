@@ -0,0 +1,259 @@
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.CollectionFields import ImageFields
+from OpenNumismat.Collection.IndexManager import IndexManager
+
+
+class Merge:
+    """Merges collection attached as src into main one by set-based queries.
+
+    Coins with unknown creation time are inserted, coins with same ID and
+    creation time are updated when source one is newer. Images are shared
+    with main collection by content hash. Coins are merged by chunks, each
+    chunk could be committed separately.
+    """
+    CHUNK_SIZE = 500
+
+    def __init__(self, db):
+        self.db = db
+        self.inserted = 0
+        self.updated = 0
+        self.chunks = []
+        self.error = None
+
+        query = QSqlQuery("PRAGMA table_info(coins)", self.db)
+        self.fields = []
+        while query.next():
+            self.fields.append(query.record().value('name'))
+        self.fields.remove('id')
+
+        self.photoFields = [field for field in ImageFields
+                            if field in self.fields]
+        self.plainFields = [field for field in self.fields
+                            if field not in self.photoFields and
+                            field not in ('image', 'sort_id')]
+        # Tables with images and coin fields refers to them
+        self.imageTables = (('photos', ('title', 'image'), self.photoFields),
+                            ('images', ('image',), ('image',)))
+
+    def prepare(self):
+        # Matching by creation time uses index in main collection, source
+        # collection is only scanned once
+        self.__exec(IndexManager.createSql('createdat'))
+
+        self.__dropTempTables()
+
+        image_fields = self.photoFields + ['image']
+        columns = ', '.join(['src_%s, dst_%s' % (f, f) for f in image_fields])
+        self.__exec("CREATE TEMP TABLE merge_updated (id INTEGER PRIMARY KEY, %s)" % columns)
+        values = ', '.join(['s.%s, c.%s' % (f, f) for f in image_fields])
+        self.__exec("INSERT INTO temp.merge_updated SELECT s.id, %s"
+                    " FROM src.coins s JOIN coins c ON c.id=s.id"
+                    " WHERE c.createdat=s.createdat AND s.updatedat>c.updatedat" % values)
+
+        self.__exec("CREATE TEMP TABLE merge_inserted (src_id INTEGER PRIMARY KEY)")
+        self.__exec("INSERT INTO temp.merge_inserted SELECT s.id FROM src.coins s"
+                    " WHERE s.createdat IS NOT NULL AND NOT EXISTS"
+                    " (SELECT 1 FROM coins c WHERE c.createdat=s.createdat)")
+
+        self.__exec("CREATE TEMP TABLE merge_chunk (id INTEGER PRIMARY KEY)")
+        for table, _columns, _fields in self.imageTables:
+            self.__exec("CREATE TEMP TABLE merge_%s_new (src_id INTEGER PRIMARY KEY)" % table)
+            # New IDs of source images
+            self.__exec("CREATE TEMP TABLE merge_%s_map"
+                        " (src_id INTEGER PRIMARY KEY, dst_id INTEGER)" % table)
+            self.__exec("CREATE TEMP TABLE merge_%s_refs (id INTEGER, delta INTEGER)" % table)
+            self.__exec("CREATE INDEX temp.merge_%s_refs_id ON merge_%s_refs(id)" % (table, table))
+
+        # Source images are inserted with shifted IDs, so new ID of each
+        # image doesn't depend on chunk
+        self.offsets = {}
+        for table, _columns, _fields in self.imageTables:
+            self.offsets[table] = self.__value("SELECT MAX(id) FROM %s" % table) or 0
+        self.sortOffset = self.__value("SELECT MAX(sort_id) FROM coins") or 0
+
+        query = self.__exec("SELECT id FROM temp.merge_updated"
+                            " UNION SELECT src_id FROM temp.merge_inserted"
+                            " ORDER BY 1")
+        ids = []
+        while query.next():
+            ids.append(query.record().value(0))
+        self.chunks = [(ids[i], ids[min(i + self.CHUNK_SIZE, len(ids)) - 1])
+                       for i in range(0, len(ids), self.CHUNK_SIZE)]
+
+        self.__prepareStatements()
+
+    def mergeChunk(self, first, last):
+        self.__execPrepared(self.clearChunkQuery)
+        for pos, value in enumerate((first, last, first, last)):
+            self.chunkQuery.bindValue(pos, value)
+        self.__execPrepared(self.chunkQuery)
+
+        for query in self.statements:
+            self.__execPrepared(query)
+
+        self.updated += self.__countPrepared(self.updatedCountQuery)
+        self.inserted += self.__countPrepared(self.insertedCountQuery)
+
+    def finish(self):
+        self.clearChunkQuery = None
+        self.chunkQuery = None
+        self.statements = []
+        self.__dropTempTables()
+
+    def __prepareStatements(self):
+        self.statements = []
+
+        self.clearChunkQuery = self.__prepare("DELETE FROM temp.merge_chunk")
+        self.chunkQuery = self.__prepare(
+            "INSERT INTO temp.merge_chunk SELECT id FROM temp.merge_updated"
+            " WHERE id BETWEEN ? AND ?"
+            " UNION SELECT src_id FROM temp.merge_inserted"
+            " WHERE src_id BETWEEN ? AND ?")
+
+        for table, columns, fields in self.imageTables:
+            self.__prepareImageStatements(table, columns, fields)
+
+        self.__prepareUpdate()
+        self.__prepareInsert()
+
+        self.updatedCountQuery = self.__prepare(
+            "SELECT COUNT(*) FROM temp.merge_updated"
+            " WHERE id IN (SELECT id FROM temp.merge_chunk)")
+        self.insertedCountQuery = self.__prepare(
+            "SELECT COUNT(*) FROM temp.merge_inserted"
+            " WHERE src_id IN (SELECT id FROM temp.merge_chunk)")
+
+    def __prepareImageStatements(self, table, columns, fields):
+        for temp_table in ('new', 'map', 'refs'):
+            self.statements.append(self.__prepare(
+                "DELETE FROM temp.merge_%s_%s" % (table, temp_table)))
+
+        for f in fields:
+            self.statements.append(self.__prepare(
+                "INSERT OR IGNORE INTO temp.merge_%s_new SELECT src_%s"
+                " FROM temp.merge_updated"
+                " WHERE id IN (SELECT id FROM temp.merge_chunk)"
+                " AND src_%s IS NOT NULL" % (table, f, f)))
+            self.statements.append(self.__prepare(
+                "INSERT OR IGNORE INTO temp.merge_%s_new SELECT s.%s"
+                " FROM src.coins s JOIN temp.merge_inserted m ON m.src_id=s.id"
+                " WHERE m.src_id IN (SELECT id FROM temp.merge_chunk)"
+                " AND s.%s IS NOT NULL" % (table, f, f)))
+
+        # Images already stored in main collection are reused
+        if table == 'photos':
+            match = "i.hash=s.hash AND ifnull(i.title,'')=ifnull(s.title,'')"
+        else:
+            match = "i.hash=s.hash"
+        self.statements.append(self.__prepare(
+            "INSERT INTO temp.merge_%s_map SELECT n.src_id, min(i.id)"
+            " FROM temp.merge_%s_new n JOIN src.%s s ON s.id=n.src_id"
+            " JOIN %s i ON %s GROUP BY n.src_id" % (
+                table, table, table, table, match)))
+        sql_columns = ', '.join(columns)
+        self.statements.append(self.__prepare(
+            "INSERT INTO %s (id, %s, hash, refs) SELECT id+%d, %s, hash, 0"
+            " FROM src.%s WHERE id IN (SELECT src_id FROM temp.merge_%s_new)"
+            " AND id NOT IN (SELECT src_id FROM temp.merge_%s_map)" % (
+                table, sql_columns, self.offsets[table], sql_columns, table,
+                table, table)))
+        self.statements.append(self.__prepare(
+            "INSERT INTO temp.merge_%s_map SELECT src_id, src_id+%d"
+            " FROM temp.merge_%s_new"
+            " WHERE src_id NOT IN (SELECT src_id FROM temp.merge_%s_map)" % (
+                table, self.offsets[table], table, table)))
+
+        # Changing of references counters
+        for f in fields:
+            self.statements.append(self.__prepare(
+                "INSERT INTO temp.merge_%s_refs SELECT dst_%s, -1"
+                " FROM temp.merge_updated"
+                " WHERE id IN (SELECT id FROM temp.merge_chunk)"
+                " AND dst_%s IS NOT NULL" % (table, f, f)))
+            self.statements.append(self.__prepare(
+                "INSERT INTO temp.merge_%s_refs SELECT map.dst_id, 1"
+                " FROM temp.merge_updated m"
+                " JOIN temp.merge_%s_map map ON map.src_id=m.src_%s"
+                " WHERE m.id IN (SELECT id FROM temp.merge_chunk)" % (
+                    table, table, f)))
+            self.statements.append(self.__prepare(
+                "INSERT INTO temp.merge_%s_refs SELECT map.dst_id, 1"
+                " FROM src.coins s JOIN temp.merge_inserted m ON m.src_id=s.id"
+                " JOIN temp.merge_%s_map map ON map.src_id=s.%s"
+                " WHERE m.src_id IN (SELECT id FROM temp.merge_chunk)" % (
+                    table, table, f)))
+        self.statements.append(self.__prepare(
+            "UPDATE %s SET refs=coalesce(refs, 0)+"
+            "(SELECT sum(delta) FROM temp.merge_%s_refs r WHERE r.id=%s.id)"
+            " WHERE id IN (SELECT id FROM temp.merge_%s_refs)" % (
+                table, table, table, table)))
+        self.statements.append(self.__prepare(
+            "DELETE FROM %s WHERE refs<=0"
+            " AND id IN (SELECT id FROM temp.merge_%s_refs)" % (table, table)))
+
+    def __prepareUpdate(self):
+        fields = self.plainFields + self.photoFields + ['image']
+        values = ['s.%s' % f for f in self.plainFields]
+        for table, _columns, image_fields in self.imageTables:
+            for f in image_fields:
+                values.append("(SELECT dst_id FROM temp.merge_%s_map"
+                              " WHERE src_id=m.src_%s)" % (table, f))
+
+        self.statements.append(self.__prepare(
+            "UPDATE coins SET (%s)=(SELECT %s FROM temp.merge_updated m"
+            " JOIN src.coins s ON s.id=m.id WHERE m.id=coins.id)"
+            " WHERE id IN (SELECT id FROM temp.merge_updated"
+            " WHERE id IN (SELECT id FROM temp.merge_chunk))" % (
+                ', '.join(fields), ', '.join(values))))
+
+    def __prepareInsert(self):
+        fields = self.plainFields + self.photoFields + ['image', 'sort_id']
+        values = ['s.%s' % f for f in self.plainFields]
+        for table, _columns, image_fields in self.imageTables:
+            for f in image_fields:
+                values.append("(SELECT dst_id FROM temp.merge_%s_map"
+                              " WHERE src_id=s.%s)" % (table, f))
+        values.append("s.id+%d" % self.sortOffset)
+
+        self.statements.append(self.__prepare(
+            "INSERT INTO coins (%s) SELECT %s FROM src.coins s"
+            " JOIN temp.merge_inserted m ON m.src_id=s.id"
+            " WHERE m.src_id IN (SELECT id FROM temp.merge_chunk)"
+            " ORDER BY s.id" % (', '.join(fields), ', '.join(values))))
+
+    def __dropTempTables(self):
+        for table in ('merge_updated', 'merge_inserted', 'merge_chunk',
+                      'merge_photos_new', 'merge_photos_map', 'merge_photos_refs',
+                      'merge_images_new', 'merge_images_map', 'merge_images_refs'):
+            self.__exec("DROP TABLE IF EXISTS temp.%s" % table)
+
+    def __prepare(self, sql):
+        query = QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        if not query.prepare(sql) and not self.error:
+            self.error = query.lastError().text()
+        return query
+
+    def __execPrepared(self, query):
+        if not query.exec_() and not self.error:
+            self.error = query.lastError().text()
+        query.finish()
+
+    def __countPrepared(self, query):
+        count = 0
+        if query.exec_() and query.next():
+            count = query.record().value(0)
+        query.finish()
+        return count
+
+    def __exec(self, sql):
+        query = QSqlQuery(self.db)
+        if not query.exec_(sql) and not self.error:
+            self.error = query.lastError().text()
+        return query
+
+    def __value(self, sql):
+        query = self.__exec(sql)
+        query.first()
+        return query.record().value(0)
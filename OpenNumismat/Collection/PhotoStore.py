@@ -0,0 +1,234 @@
+import hashlib
+import os
+import shutil
+
+from PyQt5 import QtCore
+from PyQt5.QtSql import QSqlQuery
+
+
+def imageHash(image):
+    if isinstance(image, QtCore.QByteArray):
+        data = image.data()
+    elif isinstance(image, bytes):
+        data = image
+    else:
+        # Not stored data can't be deduplicated
+        return None
+
+    return hashlib.sha1(data).hexdigest()
+
+
+class PhotoStore:
+    """Content-addressed storage of images with reference counting.
+
+    Identical images (with identical titles) referenced by many coins are
+    stored in table once. In external mode image data is stored in files
+    of sidecar directory named by hash of content only and image column is
+    NULL, so photos with different titles share one file.
+    """
+
+    def __init__(self, db, statements, table):
+        self.db = db
+        self.statements = statements
+        self.table = table
+        self.hasTitle = (table == 'photos')
+        self.directory = None
+        self.external = False
+
+    def open(self, directory, external=False):
+        # Directory is used for reading even if external mode is disabled
+        self.directory = os.path.join(directory, self.table)
+        self.external = external
+
+    @staticmethod
+    def sidecarDirectory(fileName):
+        return os.path.splitext(fileName)[0] + '_images'
+
+    def fileName(self, hash_):
+        return os.path.join(self.directory, hash_[:2], hash_)
+
+    def imageData(self, image, hash_):
+        if image or not hash_ or not self.directory:
+            return image
+
+        try:
+            with open(self.fileName(hash_), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        if not data:
+            return None
+
+        return QtCore.QByteArray(data)
+
+    def __writeFile(self, image, hash_):
+        fileName = self.fileName(hash_)
+        if os.path.isfile(fileName):
+            return True
+
+        data = image.data() if isinstance(image, QtCore.QByteArray) else image
+        try:
+            os.makedirs(os.path.dirname(fileName), exist_ok=True)
+            tmpFileName = fileName + '.tmp'
+            with open(tmpFileName, 'wb') as f:
+                f.write(data)
+            os.replace(tmpFileName, fileName)
+        except OSError:
+            return False
+
+        return True
+
+    def add(self, image, title=None):
+        if not self.hasTitle:
+            title = None
+
+        hash_ = imageHash(image)
+        if hash_:
+            if self.hasTitle:
+                query = self.statements.query(
+                    "SELECT id FROM photos WHERE hash=? AND ifnull(title,'')=?")
+                query.bindValue(0, hash_)
+                query.bindValue(1, title or '')
+            else:
+                query = self.statements.query(
+                    "SELECT id FROM %s WHERE hash=?" % self.table)
+                query.bindValue(0, hash_)
+            query.exec_()
+            if query.next():
+                img_id = query.record().value(0)
+                query.finish()
+
+                query = self.statements.query(
+                    "UPDATE %s SET refs=refs+1 WHERE id=?" % self.table)
+                query.bindValue(0, img_id)
+                query.exec_()
+
+                return img_id
+            query.finish()
+
+        if self.external and hash_ and self.directory:
+            if self.__writeFile(image, hash_):
+                image = None
+
+        if self.hasTitle:
+            query = self.statements.query(
+                "INSERT INTO photos (title, image, hash, refs) VALUES (?, ?, ?, 1)")
+            query.bindValue(0, title)
+            query.bindValue(1, image)
+            query.bindValue(2, hash_)
+        else:
+            query = self.statements.query(
+                "INSERT INTO %s (image, hash, refs) VALUES (?, ?, 1)" % self.table)
+            query.bindValue(0, image)
+            query.bindValue(1, hash_)
+        query.exec_()
+
+        return query.lastInsertId()
+
+    def release(self, img_id):
+        query = self.statements.query(
+            "UPDATE %s SET refs=refs-1 WHERE id=?" % self.table)
+        query.bindValue(0, img_id)
+        query.exec_()
+
+        query = self.statements.query(
+            "DELETE FROM %s WHERE id=? AND refs<=0" % self.table)
+        query.bindValue(0, img_id)
+        query.exec_()
+
+    def replace(self, img_id, image, title=None):
+        # Adding before releasing keeps unchanged image in place
+        new_id = self.add(image, title)
+        self.release(img_id)
+
+        return new_id
+
+    def importFiles(self, src):
+        """Makes external images received from src store available"""
+        if not self.directory:
+            return
+
+        query = QSqlQuery(self.db)
+        query.exec_("SELECT id, hash FROM %s WHERE image IS NULL"
+                    " AND hash IS NOT NULL" % self.table)
+        while query.next():
+            img_id = query.record().value(0)
+            hash_ = query.record().value(1)
+            if os.path.isfile(self.fileName(hash_)):
+                continue
+
+            data = src.imageData(None, hash_)
+            if data is None:
+                continue
+
+            if self.external:
+                self.__writeFile(data, hash_)
+            else:
+                update = QSqlQuery(self.db)
+                update.prepare("UPDATE %s SET image=? WHERE id=?" % self.table)
+                update.addBindValue(data)
+                update.addBindValue(img_id)
+                update.exec_()
+
+    def collectGarbage(self):
+        # Files are removed only here, so rolled back deleting of rows
+        # doesn't lose image data
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+
+        hashes = set()
+        query = QSqlQuery(self.db)
+        query.exec_("SELECT hash FROM %s WHERE image IS NULL" % self.table)
+        while query.next():
+            hashes.add(query.record().value(0))
+
+        for dirpath, _dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name not in hashes:
+                    try:
+                        os.remove(os.path.join(dirpath, name))
+                    except OSError:
+                        pass
+
+    def backup(self, directory):
+        """Copies files missed in backup directory"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return True
+
+        dst_directory = os.path.join(directory, self.table)
+        try:
+            for dirpath, _dirnames, filenames in os.walk(self.directory):
+                dst_dirpath = os.path.join(
+                    dst_directory, os.path.relpath(dirpath, self.directory))
+                for name in filenames:
+                    if name.endswith('.tmp'):
+                        continue
+                    dst_fileName = os.path.join(dst_dirpath, name)
+                    if not os.path.isfile(dst_fileName):
+                        os.makedirs(dst_dirpath, exist_ok=True)
+                        shutil.copyfile(os.path.join(dirpath, name),
+                                        dst_fileName)
+        except OSError:
+            return False
+
+        return True
+
+    @staticmethod
+    def createTables(db):
+        sql = "CREATE TABLE photos (id INTEGER PRIMARY KEY, title TEXT,"\
+              " image BLOB, hash TEXT, refs INTEGER)"
+        QSqlQuery(sql, db)
+        sql = "CREATE TABLE images (id INTEGER PRIMARY KEY, image BLOB,"\
+              " hash TEXT, refs INTEGER)"
+        QSqlQuery(sql, db)
+
+        PhotoStore.createIndexes(db)
+
+    @staticmethod
+    def createIndexes(db):
+        # Photos with same content but different titles are different rows
+        sql = "CREATE INDEX IF NOT EXISTS photos_hash ON photos(hash, title)"
+        QSqlQuery(sql, db)
+        sql = "CREATE UNIQUE INDEX IF NOT EXISTS images_hash ON images(hash)"
+        QSqlQuery(sql, db)
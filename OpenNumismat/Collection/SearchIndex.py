@@ -0,0 +1,159 @@
+from PyQt5.QtSql import QSqlQuery
+from PyQt5.QtWidgets import QApplication
+
+from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
+from OpenNumismat.Tools import Gui
+
+
+class SearchIndex:
+    """Full-text trigram index over text columns of coins table.
+
+    Index is a contentless FTS5 table in temporary database of connection,
+    it's filled on first full-text search and follows every change of coins
+    table (editing, deleting, merging) by temporary triggers. So collection
+    file stays the same and can be changed by SQLite without FTS5 module,
+    and opening of collection doesn't wait for indexing.
+
+    Trigram tokenizer folds case of all Unicode letters, while LIKE of
+    fallback search (short texts or SQLite without FTS5) folds only ASCII
+    letters, so results for non-ASCII texts could differ in letter case.
+    """
+    TABLE = 'coins_fts'
+    # Trigram tokenizer can't match strings shorter than 3 characters
+    MIN_LENGTH = 3
+    CHUNK_SIZE = 1000
+
+    def __init__(self, db, parent=None):
+        self.db = db
+        self.parent = parent
+        # None until index is built by first search
+        self.available = None
+        self.columns = []
+
+    def open(self, fields):
+        self.columns = [field.name for field in fields.userFields
+                        if field.type not in Type.ImageTypes]
+
+        # Index stored in collection file by previous versions
+        self.__drop('main')
+
+        self.__drop('temp')
+        self.available = None
+
+    def filter(self, text, columns):
+        if len(text) < self.MIN_LENGTH:
+            return None
+
+        for column in columns:
+            if column not in self.columns:
+                return None
+
+        if self.available is None:
+            # Cancelled indexing falls back to LIKE until collection reopened
+            self.available = self.__create()
+        if not self.available:
+            return None
+
+        phrase = '"%s"' % text.replace('"', '""')
+        match = "{%s} : %s" % (' '.join(columns), phrase)
+
+        return "id IN (SELECT rowid FROM temp.%s WHERE %s MATCH '%s')" % (
+            self.TABLE, self.TABLE, match.replace("'", "''"))
+
+    def __create(self):
+        self.db.transaction()
+
+        columns = ', '.join(self.columns)
+        sql = "CREATE VIRTUAL TABLE temp.%s USING fts5(%s, content='',"\
+              " tokenize='trigram')" % (self.TABLE, columns)
+        query = QSqlQuery(self.db)
+        if not query.exec_(sql):
+            self.db.rollback()
+            return False
+
+        new_values = ', '.join('new.' + column for column in self.columns)
+        old_values = ', '.join('old.' + column for column in self.columns)
+        sql_insert = "INSERT INTO %s (rowid, %s) VALUES (new.id, %s);" % (
+            self.TABLE, columns, new_values)
+        sql_delete = "INSERT INTO %s (%s, rowid, %s) VALUES ('delete', old.id, %s);" % (
+            self.TABLE, self.TABLE, columns, old_values)
+
+        sqls = (
+            "CREATE TEMP TRIGGER %s_insert AFTER INSERT ON main.coins BEGIN %s END" % (
+                self.TABLE, sql_insert),
+            "CREATE TEMP TRIGGER %s_delete AFTER DELETE ON main.coins BEGIN %s END" % (
+                self.TABLE, sql_delete),
+            # Position and image changes don't touch index
+            "CREATE TEMP TRIGGER %s_update AFTER UPDATE OF id, %s ON main.coins BEGIN %s %s END" % (
+                self.TABLE, columns, sql_delete, sql_insert),
+        )
+        for sql in sqls:
+            query = QSqlQuery(self.db)
+            if not query.exec_(sql):
+                self.db.rollback()
+                self.__drop('temp')
+                return False
+
+        if not self.__fill(columns):
+            self.db.rollback()
+            self.__drop('temp')
+            return False
+
+        self.db.commit()
+
+        return True
+
+    def __fill(self, columns):
+        query = QSqlQuery("SELECT count(*) FROM coins", self.db)
+        query.next()
+        count = query.record().value(0)
+
+        progressDlg = Gui.ProgressDialog(
+            QApplication.translate("SearchIndex", "Indexing records"),
+            QApplication.translate("SearchIndex", "Cancel"),
+            count, self.parent)
+
+        insertQuery = QSqlQuery(self.db)
+        insertQuery.prepare(
+            "INSERT INTO temp.%s (rowid, %s) SELECT id, %s FROM coins"
+            " WHERE id>? ORDER BY id LIMIT %d" % (
+                self.TABLE, columns, columns, self.CHUNK_SIZE))
+        lastQuery = QSqlQuery(self.db)
+        lastQuery.prepare(
+            "SELECT max(id), count(*) FROM (SELECT id FROM coins"
+            " WHERE id>? ORDER BY id LIMIT %d)" % self.CHUNK_SIZE)
+
+        last_id = -1
+        done = 0
+        while done < count:
+            lastQuery.addBindValue(last_id)
+            lastQuery.exec_()
+            lastQuery.next()
+            chunk_last_id = lastQuery.record().value(0)
+            chunk_count = lastQuery.record().value(1)
+            lastQuery.finish()
+            if not chunk_count:
+                break
+
+            insertQuery.addBindValue(last_id)
+            if not insertQuery.exec_():
+                progressDlg.reset()
+                return False
+
+            last_id = chunk_last_id
+            done += chunk_count
+
+            progressDlg.setValue(min(done, count))
+            if progressDlg.wasCanceled():
+                return False
+
+        progressDlg.reset()
+
+        return True
+
+    def __drop(self, schema):
+        for trigger in ('insert', 'delete', 'update'):
+            QSqlQuery("DROP TRIGGER IF EXISTS %s.%s_%s" % (
+                schema, self.TABLE, trigger), self.db)
+        QSqlQuery("DROP TABLE IF EXISTS %s.%s" % (schema, self.TABLE),
+                  self.db)
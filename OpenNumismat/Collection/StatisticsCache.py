@@ -0,0 +1,151 @@
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.FilterExpr import Raw
+
+
+def recordValues(record):
+    values = {}
+    for i in range(record.count()):
+        values[record.fieldName(i)] = None if record.isNull(i) else record.value(i)
+
+    return values
+
+
+class StatisticsGroups:
+    """Counts of coins grouped by fields, result of one statistics query"""
+
+    def __init__(self, fields, countField, expr, revision):
+        self.fields = fields
+        self.countField = countField
+        self.expr = expr
+        self.revision = revision
+        # Grows on each change of counts
+        self.version = 0
+        # Counts could be changed by deltas only when filter could be
+        # checked in memory
+        self.incremental = not any(isinstance(node, Raw)
+                                   for node in expr.walk())
+        self._groups = {}
+
+    def statement(self, tables=True):
+        """Returns SQL and bound values of query, rows of it are
+        (count, values of fields)"""
+        where, params = self.expr.compile(tables)
+        count = "count(%s)" % (self.countField or '*')
+        sql = "SELECT %s, %s FROM coins" % (count, ','.join(self.fields))
+        if where:
+            sql += " WHERE %s" % where
+        sql += " GROUP BY %s" % ','.join(self.fields)
+
+        return sql, params
+
+    def load(self, db):
+        sql, params = self.statement()
+        query = QSqlQuery(db)
+        query.setForwardOnly(True)
+        query.prepare(sql)
+        for pos, value in enumerate(params):
+            query.bindValue(pos, value)
+        query.exec_()
+
+        rows = []
+        while query.next():
+            record = query.record()
+            rows.append([record.value(i) for i in range(record.count())])
+        self.setRows(rows)
+
+    def setRows(self, rows):
+        for row in rows:
+            values = tuple(row[1:])
+            key = tuple(str(value) for value in values)
+            if key in self._groups:
+                # Values of different types are grouped separately
+                self.incremental = False
+            self._groups[key] = [row[0], values]
+
+    def rows(self):
+        """List of (count, values) in order of GROUP BY"""
+        return [(count, values) for count, values in self._groups.values()]
+
+    def apply(self, changes):
+        """Applies list of (record, delta), returns False when counts can't
+        be updated in place"""
+        deltas = {}
+        for record, delta in changes:
+            if not self.expr.matches(recordValues(record)):
+                continue
+            if self.countField and record.isNull(self.countField):
+                # Group of not counted value could appear or disappear
+                return False
+
+            key = tuple(str(record.value(field)) for field in self.fields)
+            deltas[key] = deltas.get(key, 0) + delta
+
+        changed = False
+        for key, delta in deltas.items():
+            if not delta:
+                continue
+            if key not in self._groups:
+                # Place of new group is defined by database ordering
+                return False
+
+            group = self._groups[key]
+            group[0] += delta
+            if group[0] < 0:
+                return False
+            if group[0] == 0:
+                del self._groups[key]
+            changed = True
+
+        if changed:
+            self.version += 1
+
+        return True
+
+
+class StatisticsCache:
+    """Grouped counts used by statistics charts.
+
+    Results are keyed by grouped fields and filter. Coins changed through
+    model are applied to results as deltas, so charts are refreshed without
+    scanning table. Results are valid only for revision of collection data
+    they are made or updated for.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, fields, countField, expr, revision):
+        entry = self._entries.get(self.__key(fields, countField, expr))
+        if entry and entry.revision == revision:
+            return entry
+
+        return None
+
+    def load(self, db, fields, countField, expr, revision):
+        entry = StatisticsGroups(fields, countField, expr, revision)
+        entry.load(db)
+        self.add(entry)
+
+        return entry
+
+    def add(self, entry):
+        key = self.__key(entry.fields, entry.countField, entry.expr)
+        self._entries[key] = entry
+
+    def apply(self, changes, startRevision, revision):
+        """Updates results made before changes, others become outdated"""
+        for key, entry in list(self._entries.items()):
+            if entry.revision != startRevision or not entry.incremental:
+                del self._entries[key]
+            elif entry.apply(changes):
+                entry.revision = revision
+            else:
+                del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    @staticmethod
+    def __key(fields, countField, expr):
+        return (tuple(fields), countField, expr.toSql())
@@ -19,6 +19,8 @@ class StatisticsParam(BaseSettings):
 
         self.pageId = page.id
         self.db = page.db
+        self.fields = page.fields
+        self.indexManager = page.indexManager
         if 'statistics' not in self.db.tables():
             self.create(self.db)
 
@@ -70,6 +72,8 @@ class StatisticsParam(BaseSettings):
 
         self.db.commit()
 
+        self.indexManager.update()
+
     def remove(self):
         query = QSqlQuery(self.db)
         query.prepare("DELETE FROM statistics WHERE pageid=?")
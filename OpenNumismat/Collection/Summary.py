@@ -0,0 +1,122 @@
+from PyQt5.QtSql import QSqlQuery
+
+
+def sqlList(values):
+    return ', '.join("'%s'" % value for value in values)
+
+
+class Summary:
+    """Summary metrics of collection.
+
+    Counts, sums and dates are calculated by conditional aggregates in one
+    scan of coins, estimations need prices of each coin and are calculated
+    by second scan of coins with prices only.
+    """
+    OWNED_STATUSES = ('owned', 'ordered', 'sale')
+    PAID_STATUSES = ('owned', 'ordered', 'sale', 'sold', 'missing')
+    COUNTED_STATUSES = ('wish', 'sold', 'bidding', 'missing')
+
+    def __init__(self, db):
+        self.db = db
+
+    def calculate(self):
+        result = self.__aggregate()
+        result.update(self.__estimate())
+
+        # Image shared by many coins is counted for each of them
+        query = QSqlQuery("SELECT ifnull(sum(refs), 0) FROM photos", self.db)
+        if query.first():
+            result['images'] = query.record().value(0)
+
+        return result
+
+    def __aggregate(self):
+        owned = sqlList(self.OWNED_STATUSES)
+        paid = sqlList(self.PAID_STATUSES)
+
+        columns = [('count', "count(*)"),
+                   ('owned', "sum(status IN (%s))" % owned)]
+        for status in self.COUNTED_STATUSES:
+            columns.append((status, "sum(status='%s')" % status))
+        for name, condition, field in (
+                ('paid', "status IN (%s)" % paid, 'totalpayprice'),
+                ('paid_without_commission', "status IN (%s)" % paid, 'payprice'),
+                ('earned', "status='sold'", 'totalsaleprice'),
+                ('earned_without_commission', "status='sold'", 'saleprice')):
+            columns.append((name, "sum(CASE WHEN %s AND %s<>'' THEN %s END)" % (
+                condition, field, field)))
+        columns.append(('first_paydate',
+                        "min(CASE WHEN status IN (%s) AND paydate<>''"
+                        " THEN paydate END)" % paid))
+
+        sql = "SELECT %s FROM coins" % ', '.join(sql for _name, sql in columns)
+        query = QSqlQuery(sql, self.db)
+
+        result = {}
+        if query.first():
+            record = query.record()
+            for i, (name, _sql) in enumerate(columns):
+                result[name] = None if record.isNull(i) else record.value(i)
+
+        # Sums over empty collection are NULL
+        for name in ['owned'] + list(self.COUNTED_STATUSES):
+            result[name] = result.get(name) or 0
+
+        return result
+
+    def __estimate(self):
+        result = {'estimation_owned': 0, 'estimation_owned_count': 0,
+                  'estimation_wish': 0, 'estimation_wish_count': 0}
+
+        sql = "SELECT status, UPPER(grade), price1, price2, price3, price4"\
+              " FROM coins WHERE status IN (%s, 'wish') AND"\
+              " (ifnull(price1,'')<>'' OR ifnull(price2,'')<>''"\
+              " OR ifnull(price3,'')<>'' OR ifnull(price4,'')<>'')" % \
+              sqlList(self.OWNED_STATUSES)
+        query = QSqlQuery(sql, self.db)
+        while query.next():
+            record = query.record()
+            status = record.value(0)
+            grade = record.value(1)
+            prices = [record.value(i) for i in range(2, 6)]
+
+            try:
+                if status == 'wish':
+                    price = self.__wishPrice(*prices)
+                    key = 'estimation_wish'
+                else:
+                    price = self.__gradePrice(grade, *prices)
+                    key = 'estimation_owned'
+
+                if price:
+                    result[key] += price
+                    result[key + '_count'] += 1
+            except TypeError:
+                continue
+
+        return result
+
+    @staticmethod
+    def __wishPrice(price1, price2, price3, price4):
+        return price4 if price4 else price3 if price3 else price2 if price2 else price1 if price1 else 0
+
+    @staticmethod
+    def __gradePrice(grade, price1, price2, price3, price4):
+        if grade[:2] in ('UN', 'MS'):
+            price = price4 if price4 else price3 * 1.6 if price3 else price2 * 2.2 if price2 else price1 * 5.5 if price1 else 0
+        elif grade[:2] in ('XF', 'EF'):
+            price = price3 if price3 else price4 * 0.6 if price4 else price2 * 1.4 if price2 else price1 * 3.5 if price1 else 0
+        elif grade[:2] in ('AU',):
+            priceU = price4 if price4 else price3 * 1.6 if price3 else price2 * 2.2 if price2 else price1 * 5.5 if price1 else 0
+            priceX = price3 if price3 else price4 * 0.6 if price4 else price2 * 1.4 if price2 else price1 * 3.5 if price1 else 0
+            price = priceX + (priceU - priceX) * 0.6
+        elif grade[:2] in ('VF',):
+            price = price2 if price2 else price3 * 0.7 if price3 else price4 * 0.45 if price4 else price1 * 2.5 if price1 else 0
+        elif grade[:2] in ('F', 'FI'):
+            price = price1 if price1 else price2 * 0.4 if price2 else price3 * 0.3 if price3 else price4 * 0.18 if price4 else 0
+        elif grade[:2] in ('VG',):
+            price = price1 * 0.5 if price1 else price2 * 0.2 if price2 else price3 * 0.14 if price3 else price4 * 0.09 if price4 else 0
+        else:
+            price = price4 if price4 else price3 if price3 else price2 if price2 else price1 if price1 else 0
+
+        return price
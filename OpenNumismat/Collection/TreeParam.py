@@ -3,6 +3,9 @@ from PyQt5.QtSql import QSqlDatabase, QSqlQuery
 
 
 class TreeParam(QtCore.QObject):
+    DefaultParams = (('type',), ('country',), ('period',), ('value', 'unit'),
+                     ('series',), ('year',))
+
     def __init__(self, page):
         QtCore.QObject.__init__(self, page)
 
@@ -12,14 +15,12 @@ class TreeParam(QtCore.QObject):
             self.create(self.db)
 
         self.fields = page.fields
+        self.indexManager = page.indexManager
         self._params = []
         self._load()
         if not self._params:
-            allFields = self.fields
-            self._params = [[allFields.type, ], [allFields.country, ],
-                            [allFields.period, ],
-                            [allFields.value, allFields.unit],
-                            [allFields.series, ], [allFields.year, ]]
+            self._params = [[getattr(self.fields, name) for name in param]
+                            for param in self.DefaultParams]
 
     def params(self):
         return self._params
@@ -91,6 +92,8 @@ class TreeParam(QtCore.QObject):
 
         self.db.commit()
 
+        self.indexManager.update()
+
     def remove(self):
         query = QSqlQuery(self.db)
         query.prepare("DELETE FROM treeparam WHERE pageid=?")
@@ -4,6 +4,8 @@ from PyQt5.QtSql import QSqlQuery
 from PyQt5.QtCore import QSettings
 
 from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
+from OpenNumismat.Collection.CollectionFields import ImageFields
+from OpenNumismat.Collection.PhotoStore import PhotoStore, imageHash
 from OpenNumismat.Tools import Gui
 
 
@@ -40,6 +42,9 @@ class Updater(QtCore.QObject):
             if self.currentVersion < 7:
                 updater = UpdaterTo7(self.collection)
                 updater.update()
+            if self.currentVersion < 8:
+                updater = UpdaterTo8(self.collection)
+                updater.update()
 
             self.__finalize()
 
@@ -508,6 +513,106 @@ class UpdaterTo7(_Updater):
         self._finish()
 
 
+class UpdaterTo8(_Updater):
+
+    def __init__(self, collection):
+        super().__init__(collection)
+        self.progressDlg.setMinimumDuration(0)
+
+    def getTotalCount(self):
+        count = 0
+        for table in ('photos', 'images'):
+            query = QSqlQuery("SELECT count(*) FROM %s" % table, self.db)
+            query.first()
+            count += query.record().value(0)
+
+        return count
+
+    def update(self):
+        self._begin()
+
+        self.db.transaction()
+
+        self.__updateTable('photos', ImageFields)
+        self.__updateTable('images', ('image',))
+
+        PhotoStore.createIndexes(self.db)
+
+        self.collection.settings['Version'] = 8
+        self.collection.settings.save()
+
+        self.db.commit()
+
+        self._finish()
+
+    def __updateTable(self, table, fields):
+        sql = "ALTER TABLE %s ADD COLUMN hash TEXT" % table
+        QSqlQuery(sql, self.db)
+        sql = "ALTER TABLE %s ADD COLUMN refs INTEGER" % table
+        QSqlQuery(sql, self.db)
+
+        hashes = {}
+        duplicates = {}
+        query = QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.exec_("SELECT * FROM %s" % table)
+        while query.next():
+            self._updateRecord()
+
+            record = query.record()
+            img_id = record.value('id')
+            hash_ = imageHash(record.value('image'))
+            if table == 'photos':
+                # Photo with another title is another row with same content
+                key = (hash_, record.value('title') or '')
+            else:
+                key = (hash_, '')
+
+            if key in hashes:
+                duplicates[img_id] = hashes[key]
+            elif hash_:
+                hashes[key] = img_id
+        query.finish()
+
+        for (hash_, _title), img_id in hashes.items():
+            query = QSqlQuery(self.db)
+            query.prepare("UPDATE %s SET hash=? WHERE id=?" % table)
+            query.addBindValue(hash_)
+            query.addBindValue(img_id)
+            query.exec_()
+
+        # Point coins to first of identical images and remove others
+        sql = "CREATE TEMP TABLE duplicates (id INTEGER PRIMARY KEY, orig_id INTEGER)"
+        QSqlQuery(sql, self.db)
+        for img_id, orig_id in duplicates.items():
+            query = QSqlQuery(self.db)
+            query.prepare("INSERT INTO temp.duplicates (id, orig_id) VALUES (?, ?)")
+            query.addBindValue(img_id)
+            query.addBindValue(orig_id)
+            query.exec_()
+
+        for field in fields:
+            sql = "UPDATE coins SET %s=(SELECT orig_id FROM temp.duplicates WHERE id=coins.%s)"\
+                  " WHERE %s IN (SELECT id FROM temp.duplicates)" % (field, field, field)
+            QSqlQuery(sql, self.db)
+
+        sql = "DELETE FROM %s WHERE id IN (SELECT id FROM temp.duplicates)" % table
+        QSqlQuery(sql, self.db)
+        QSqlQuery("DROP TABLE temp.duplicates", self.db)
+
+        # Count references
+        selects = ["SELECT %s AS id FROM coins" % field for field in fields]
+        sql = "CREATE TEMP TABLE image_refs (id INTEGER PRIMARY KEY, refs INTEGER)"
+        QSqlQuery(sql, self.db)
+        sql = "INSERT INTO temp.image_refs SELECT id, count(*)"\
+              " FROM (%s) WHERE id IS NOT NULL GROUP BY id" % ' UNION ALL '.join(selects)
+        QSqlQuery(sql, self.db)
+        sql = "UPDATE %s SET refs=coalesce((SELECT refs FROM temp.image_refs"\
+              " WHERE id=%s.id), 0)" % (table, table)
+        QSqlQuery(sql, self.db)
+        QSqlQuery("DROP TABLE temp.image_refs", self.db)
+
+
 def updateCollection(collection):
     updater = Updater(collection, collection.parent())
     if updater.check():
@@ -16,6 +16,7 @@ import OpenNumismat
 from OpenNumismat.EditCoinDialog.EditCoinDialog import EditCoinDialog
 from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
 from OpenNumismat.Collection.CollectionFields import StatusesOrder
+from OpenNumismat.Collection.CollectionFields import ImageFields
 from OpenNumismat.SelectColumnsDialog import SelectColumnsDialog
 from OpenNumismat.Collection.HeaderFilterMenu import FilterMenuButton
 from OpenNumismat.Tools import Gui, TemporaryDir
@@ -43,6 +44,37 @@ def clipboardToText(text):
     return text
 
 
+def isNarrowedSearch(view, text, parts):
+    # Records matched new text is subset of previous result when text only
+    # extended and searched columns not changed
+    return bool(view.searchText) and view.searchText in text and \
+        view.searchParts == parts
+
+
+def searchFilter(model, text, parts):
+    sql = model.searchIndex.filter(text, parts)
+    if sql:
+        return sql
+
+    # Fallback for short text or when full-text index not available
+    val = "'%%%s%%'" % text.replace("'", "''")
+    values = []
+    val_lower = val.lower()
+    values.append(val_lower)
+    val_upper = val.upper()
+    if val_lower != val_upper:
+        values.append(val_upper)
+        values.append(val.title())
+    if val not in values:
+        values.append(val)
+
+    sql = []
+    for part in parts:
+        for val in values:
+            sql.append("%s LIKE %s" % (part, val))
+    return '(' + ' OR '.join(sql) + ')'
+
+
 class BaseTableView(QTableView):
     rowChanged = pyqtSignal(object)
     # TODO: Changes mime type
@@ -55,6 +87,7 @@ class BaseTableView(QTableView):
 
         self.sortingChanged = False
         self.searchText = ''
+        self.searchParts = ()
         self.listParam = listParam
 
         self.selectedId = None
@@ -98,10 +131,20 @@ class BaseTableView(QTableView):
         return self.dragDropMode() == QAbstractItemView.InternalMove
 
     def modelChanged(self):
-        # Fetch all selected records
-        while self.model().canFetchMore():
-            self.model().fetchMore()
-        newCount = self.model().rowCount()
+        if self.model().settings['sql_sorting']:
+            # Records are sorted by database and fetched on scrolling
+            sql = "SELECT count(*) FROM coins"
+            where, params = self.model().filterExpr().compile()
+            if where:
+                sql += " WHERE " + where
+            query = self.model().statements.exec_(sql, params)
+            query.next()
+            newCount = query.record().value(0)
+            query.finish()
+        else:
+            # Fetch all selected records
+            self.model().fetchAll()
+            newCount = self.model().rowCount()
 
         # Show updated coins count
         sql = "SELECT count(*) FROM coins"
@@ -220,6 +263,7 @@ class BaseTableView(QTableView):
             OpenNumismat.HOME_PATH, availableFilters)
         if fileName:
             model = self.model()
+            model.fetchAll()
             progressDlg = Gui.ProgressDialog(
                 QApplication.translate('BaseTableView', "Saving list"),
                 QApplication.translate('BaseTableView', "Cancel"),
@@ -257,7 +301,7 @@ class BaseTableView(QTableView):
                     break
 
                 index = self._mapToSource(self.proxyModel.index(i, 0))
-                record = model.record(index.row())
+                record = model.record(index.row(), lazy=True)
                 parts = []
                 for param in self.listParam.columns:
                     field = model.fields.field(param.fieldid)
@@ -302,7 +346,7 @@ class BaseTableView(QTableView):
             self.model().setRecord(index.row(), updatedRecord)
             self.model().submitAll()
 
-            if record_id == self.model().record(index.row()).value('id'):
+            if record_id == self.model().record(index.row(), lazy=True).value('id'):
                 self.scrollToIndex(index)
 
     def _multiEdit(self, indexes=None):
@@ -313,7 +357,10 @@ class BaseTableView(QTableView):
         multiRecord = self.model().record(indexes[0].row())
         usedFields = [Qt.Checked] * multiRecord.count()
         for index in indexes:
-            record = self.model().record(index.row())
+            record = self.model().record(index.row(), lazy=True)
+            # Load only images that still identical in all records
+            self.model().loadImages(record, [field for field in ImageFields + ('image',)
+                                             if not multiRecord.isNull(field)])
             for i in range(multiRecord.count()):
                 value = record.value(i)
                 if multiRecord.value(i) != value or not value:
@@ -341,7 +388,7 @@ class BaseTableView(QTableView):
                 if progressDlg.wasCanceled():
                     break
 
-                record = self.model().record(index.row())
+                record = self.model().record(index.row(), lazy=True)
                 for i in range(multiRecord.count()):
                     if usedFields[i] == Qt.Checked:
                         record.setValue(i, multiRecord.value(i))
@@ -544,23 +591,61 @@ class SortFilterProxyModel(QSortFilterProxyModel):
         self.collator = QCollator(QLocale(locale))
         self.collator.setNumericMode(True)
 
+        # Sort keys are calculated once per cell until source model changed
+        self.sortKeys = {}
+        model.modelReset.connect(self.clearSortKeys)
+        model.dataChanged.connect(self.clearSortKeys)
+        model.rowsInserted.connect(self.clearSortKeys)
+        model.rowsRemoved.connect(self.clearSortKeys)
+        model.layoutChanged.connect(self.clearSortKeys)
+
+    def clearSortKeys(self, *_args):
+        self.sortKeys.clear()
+
+    def sortKey(self, index):
+        key = (index.row(), index.column())
+        try:
+            return self.sortKeys[key]
+        except KeyError:
+            pass
+
+        data = self.model.dataDisplayRole(index)
+        if index.column() == self.status_id:
+            sortKey = StatusesOrder[data]
+        elif isinstance(data, str):
+            # Keep original string for comparing with not string values
+            sortKey = (data, self.collator.sortKey(data))
+        else:
+            sortKey = data
+
+        self.sortKeys[key] = sortKey
+        return sortKey
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if self.model.settings['sql_sorting']:
+            # Keep rows in order returned by database
+            super().sort(-1, order)
+            self.model.sort(column, order)
+        else:
+            super().sort(column, order)
+
     def lessThan(self, left, right):
+        leftKey = self.sortKey(left)
+        rightKey = self.sortKey(right)
+
         if left.column() == self.status_id:
-            leftData = self.model.dataDisplayRole(left)
-            rightData = self.model.dataDisplayRole(right)
-            return StatusesOrder[leftData] < StatusesOrder[rightData]
-        else:
-            leftData = self.model.dataDisplayRole(left)
-            rightData = self.model.dataDisplayRole(right)
+            return leftKey < rightKey
 
-            if isinstance(leftData, str):
-                rightData = str(rightData)
-                return self.collator.compare(leftData, rightData) < 0
-            elif isinstance(rightData, str):
-                leftData = str(leftData)
-                return self.collator.compare(leftData, rightData) < 0
+        leftIsString = isinstance(leftKey, tuple)
+        rightIsString = isinstance(rightKey, tuple)
+        if leftIsString and rightIsString:
+            return leftKey[1].compare(rightKey[1]) < 0
+        elif leftIsString:
+            return self.collator.compare(leftKey[0], str(rightKey)) < 0
+        elif rightIsString:
+            return self.collator.compare(str(leftKey), rightKey[0]) < 0
 
-            return leftData < rightData
+        return leftKey < rightKey
 
     def flags(self, index):
         return super().flags(index) | Qt.ItemIsDragEnabled | Qt.ItemIsDropEnabled
@@ -709,9 +794,9 @@ class ListView(BaseTableView):
                                    self.horizontalHeader())
             self.headerButtons.append(btn)
 
-        filtersSql = FilterMenuButton.filtersToSql(
+        filtersExpr = FilterMenuButton.filtersExpr(
                                             self.listParam.filters.values())
-        self.model().setFilter(filtersSql)
+        self.model().setFilter(filtersExpr)
 
         self.horizontalHeader().sectionResized.disconnect(self.columnResized)
         self.horizontalHeader().sortIndicatorChanged.disconnect(
@@ -758,8 +843,14 @@ class ListView(BaseTableView):
             idIndex = self.model().fieldIndex('id')
             startIndex = self.model().index(0, idIndex)
 
-            indexes = self.proxyModel.match(startIndex, Qt.UserRole,
+            # Records sorted by database are fetched only until selected
+            # one is found
+            while True:
+                indexes = self.proxyModel.match(startIndex, Qt.UserRole,
                                         self.selectedId, 1, Qt.MatchExactly)
+                if indexes or not self.model().canFetchMore():
+                    break
+                self.model().fetchMore()
             if indexes:
                 index = self.proxyModel.index(indexes[0].row(), 1)
                 self.selectRow(index.row())
@@ -964,21 +1055,9 @@ class ListView(BaseTableView):
         self.model().moveRows(index1.row(), index2.row())
 
     def search(self, text):
-        self.searchText = text
         model = self.model()
 
         if text:
-            val = "'%%%s%%'" % text.replace("'", "''")
-            values = []
-            val_lower = val.lower()
-            values.append(val_lower)
-            val_upper = val.upper()
-            if val_lower != val_upper:
-                values.append(val_upper)
-                values.append(val.title())
-            if val not in values:
-                values.append(val)
-
             parts = []
             for param in self.listParam.columns:
                 if not param.enabled:
@@ -989,15 +1068,16 @@ class ListView(BaseTableView):
                     continue
 
                 parts.append(field.name)
+            parts = tuple(parts)
 
-            sql = []
-            for part in parts:
-                for val in values:
-                    sql.append("%s LIKE %s" % (part, val))
-            model.setSearchFilter('(' + ' OR '.join(sql) + ')')
+            narrow = isNarrowedSearch(self, text, parts)
+            model.setSearchFilter(searchFilter(model, text, parts), narrow)
+            self.searchParts = parts
         else:
             model.setSearchFilter('')
 
+        self.searchText = text
+
 
 class IconDelegate(QStyledItemDelegate):
 
@@ -1235,8 +1315,12 @@ class IconView(BaseTableView):
             idIndex = self.model().fieldIndex('id')
             startIndex = self.model().index(0, idIndex)
 
-            indexes = self.proxyModel.model.match(startIndex, Qt.DisplayRole,
+            while True:
+                indexes = self.proxyModel.model.match(startIndex, Qt.DisplayRole,
                                         self.selectedId, 1, Qt.MatchExactly)
+                if indexes or not self.model().canFetchMore():
+                    break
+                self.model().fetchMore()
             if indexes:
                 self.scrollToIndex(indexes[0])
             else:
@@ -1354,30 +1438,18 @@ class IconView(BaseTableView):
         self.model().moveRows(index1.row(), index2.row())
 
     def search(self, text):
-        self.searchText = text
         model = self.model()
 
         if text:
-            val = "'%%%s%%'" % text.replace("'", "''")
-            values = []
-            val_lower = val.lower()
-            values.append(val_lower)
-            val_upper = val.upper()
-            if val_lower != val_upper:
-                values.append(val_upper)
-                values.append(val.title())
-            if val not in values:
-                values.append(val)
-
             parts = ('title',)
-            sql = []
-            for part in parts:
-                for val in values:
-                    sql.append("%s LIKE %s" % (part, val))
-            model.setSearchFilter('(' + ' OR '.join(sql) + ')')
+            narrow = isNarrowedSearch(self, text, parts)
+            model.setSearchFilter(searchFilter(model, text, parts), narrow)
+            self.searchParts = parts
         else:
             model.setSearchFilter('')
 
+        self.searchText = text
+
 
 class CardView(IconView):
 
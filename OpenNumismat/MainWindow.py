@@ -134,6 +134,10 @@ class MainWindow(QMainWindow):
         backupCollectionAct.triggered.connect(self.backupCollectionEvent)
         self.collectionActs.append(backupCollectionAct)
 
+        restoreCollectionAct = QAction(self.tr("Restore..."), self)
+        restoreCollectionAct.triggered.connect(self.restoreCollectionEvent)
+        self.collectionActs.append(restoreCollectionAct)
+
         vacuumCollectionAct = QAction(
                                     QIcon(':/compress.png'),
                                     self.tr("Vacuum"), self)
@@ -245,6 +249,7 @@ class MainWindow(QMainWindow):
         file.addAction(openCollectionAct)
         file.addSeparator()
         file.addAction(backupCollectionAct)
+        file.addAction(restoreCollectionAct)
         file.addAction(vacuumCollectionAct)
         file.addAction(passwordCollectionAct)
         file.addAction(descriptionCollectionAct)
@@ -711,7 +716,10 @@ class MainWindow(QMainWindow):
 
     def quickSearchClicked(self):
         listView = self.viewTab.currentListView()
-        listView.search(self.quickSearch.text())
+        text = self.quickSearch.text()
+        # Nothing to do when text returned to already applied
+        if text != listView.searchText:
+            listView.search(text)
 
     def viewBrowserEvent(self):
         template = self.sender().data()
@@ -760,8 +768,18 @@ class MainWindow(QMainWindow):
     def backupCollectionEvent(self):
         self.collection.backup()
 
+    def restoreCollectionEvent(self):
+        self.viewTab.stopStatistics()
+        fileName = self.collection.restore()
+        if fileName:
+            self.openCollection(fileName)
+        else:
+            self.viewTab.restartStatistics()
+
     def vacuumCollectionEvent(self):
+        self.viewTab.stopStatistics()
         self.collection.vacuum()
+        self.viewTab.restartStatistics()
 
     def mergeCollectionEvent(self):
         fileName, _selectedFilter = QFileDialog.getOpenFileName(self,
@@ -823,9 +841,15 @@ class MainWindow(QMainWindow):
         self.setWindowTitle(version.AppName)
 
     def closeEvent(self, e):
+        if self.collection.isBackupRunning():
+            # Window is closed after backup is finished or canceled
+            e.ignore()
+            return
+
         self.__shutDown()
 
     def __shutDown(self):
+        self.viewTab.stopStatistics()
         self.__saveParams()
 
         settings = QSettings()
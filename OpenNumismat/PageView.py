@@ -13,6 +13,8 @@ from OpenNumismat.CustomizeTreeDialog import CustomizeTreeDialog
 from OpenNumismat.Tools import Gui
 from OpenNumismat.Tools.Converters import numberWithFraction
 from OpenNumismat.Collection.CollectionFields import Statuses
+from OpenNumismat.Collection.CollectionFields import ImageFields
+from OpenNumismat.Collection.FilterExpr import Expr, And, Eq, Blank
 from OpenNumismat.EditCoinDialog.DetailsTabWidget import DetailsTabWidget
 from OpenNumismat.Settings import Settings
 from OpenNumismat.Collection.CollectionPages import CollectionPageTypes
@@ -140,7 +142,7 @@ class ImageView(QWidget):
             self.imageButtons[i].stateChanged.connect(self.buttonClicked)
 
     def imageEdited(self, image):
-        record = self.model.record(self.currentIndex.row())
+        record = self.model.record(self.currentIndex.row(), lazy=True)
         record.setValue(image.field, image.image)
         self.model.setRecord(self.currentIndex.row(), record)
 #        self.model.submitAll()
@@ -199,17 +201,63 @@ class AutoToolTipDelegate(QStyledItemDelegate):
         return super().helpEvent(event, view, option, index)
 
 
+def conditionsExpr(conditions):
+    # Condition with None value selects blank values
+    return And(*[Blank(field) if value is None else Eq(field, value)
+                 for field, value in conditions])
+
+
+class TreeCache:
+    """Results of tree queries keyed by (paramIndex, filters).
+
+    Each result keeps expression of its filters, so changed coin invalidates
+    only results which could contain it.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, paramIndex, filters):
+        entry = self._entries.get((paramIndex, filters))
+        if entry:
+            return entry[1]
+
+        return None
+
+    def put(self, paramIndex, filters, expr, rows):
+        self._entries[(paramIndex, filters)] = (expr, rows)
+
+    def clear(self):
+        self._entries.clear()
+
+    def invalidate(self, record):
+        values = {}
+        for i in range(record.count()):
+            values[record.fieldName(i)] = None if record.isNull(i) else record.value(i)
+
+        keys = [key for key, (expr, _rows) in self._entries.items()
+                if expr.matches(values)]
+        for key in keys:
+            del self._entries[key]
+
+        return keys
+
+
 class TreeView(QTreeWidget):
     FiltersRole = Qt.UserRole
     FieldsRole = Qt.UserRole + 1
     ParamRole = Qt.UserRole + 2
     SortDataRole = Qt.UserRole + 3
+    ConditionsRole = Qt.UserRole + 4
+    # Key of cached result used for children, None when children not loaded
+    LoadedRole = Qt.UserRole + 5
 
     def __init__(self, treeParam, parent=None):
         super().__init__(parent)
 
         self.show_tree_icons = treeParam.show_tree_icons
         self.convert_fraction = treeParam.convert_fraction
+        self.show_tree_counts = treeParam.show_tree_counts
 
         self.setHeaderHidden(True)
         self.setAutoScroll(False)
@@ -222,6 +270,14 @@ class TreeView(QTreeWidget):
         self.collapsed.connect(self.collapsedEvent)
 
         self.treeParam = treeParam
+        self.cache = TreeCache()
+        # Coins count for each combination of all tree fields, whole tree is
+        # built from them when counts are shown
+        self.groups = None
+        self.groupFields = []
+
+        if self.show_tree_counts:
+            self.setColumnCount(2)
 
         # Changing of TreeView is enabled (by signals from model or ListView)
         self.changingEnabled = True
@@ -239,46 +295,146 @@ class TreeView(QTreeWidget):
 
         self.treeParam.rootTitle = model.title
         rootItem = QTreeWidgetItem([model.title, ])
-        rootItem.setData(0, self.ParamRole, 0)
+        rootItem.setData(0, self.ParamRole, -1)
         rootItem.setData(0, self.FiltersRole, '')
+        rootItem.setData(0, self.ConditionsRole, [])
+        rootItem.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
 
         self.addTopLevelItem(rootItem)
 
+        self.model.coinsChanged.connect(self.coinsChanged)
+
     def expandedEvent(self, item):
-        for i in range(item.childCount()):
-            child = item.child(i)
-            if child.childCount() == 0:
-                paramIndex = child.data(0, self.ParamRole) + 1
-                filters = child.data(0, self.FiltersRole)
-                self.__updateChilds(child, paramIndex, filters)
+        self.__loadChilds(item)
 
         self.resizeColumnToContents(0)
 
     def collapsedEvent(self, _parentItem):
         self.resizeColumnToContents(0)
 
+    def __loadChilds(self, item):
+        # Children are loaded when item is expanded first time
+        if item.data(0, self.LoadedRole) is None:
+            paramIndex = item.data(0, self.ParamRole) + 1
+            filters = item.data(0, self.FiltersRole)
+            item.setData(0, self.LoadedRole, (paramIndex, filters))
+            self.__updateChilds(item, paramIndex, filters)
+
+            if item.childCount() == 0:
+                item.setChildIndicatorPolicy(
+                    QTreeWidgetItem.DontShowIndicatorWhenChildless)
+
+    def __selectDistinct(self, fields, paramIndex, filters, conditions):
+        rows = self.cache.get(paramIndex, filters)
+        if rows is None:
+            expr = conditionsExpr(conditions)
+            if self.show_tree_counts:
+                rows = self.__groupDistinct(fields, expr)
+            else:
+                # Queries of one level differ only by bound values, so they
+                # are prepared once
+                sql = "SELECT DISTINCT %s FROM coins" % ','.join(fields)
+                where, params = expr.compile()
+                if where:
+                    sql += " WHERE " + where
+                query = self.model.statements.exec_(sql, params)
+                rows = []
+                while query.next():
+                    record = query.record()
+                    values = [None if record.isNull(i) else record.value(i)
+                              for i in range(record.count())]
+                    rows.append((values, None))
+                query.finish()
+
+            self.cache.put(paramIndex, filters, expr, rows)
+
+        return rows
+
+    def __loadGroups(self):
+        self.groupFields = []
+        for name in self.treeParam.usedFieldNames():
+            if name not in self.groupFields:
+                self.groupFields.append(name)
+
+        self.groups = []
+        if not self.groupFields:
+            return
+
+        sql = "SELECT %s, COUNT(*) FROM coins GROUP BY %s" % (
+            ','.join(self.groupFields), ','.join(self.groupFields))
+        query = QtSql.QSqlQuery(sql, self.db)
+        query.setForwardOnly(True)
+        query.exec_()
+        while query.next():
+            record = query.record()
+            values = {}
+            for i, name in enumerate(self.groupFields):
+                values[name] = None if record.isNull(i) else record.value(i)
+            self.groups.append((values, record.value(len(self.groupFields))))
+
+    def __groupDistinct(self, fields, expr):
+        if self.groups is None:
+            self.__loadGroups()
+
+        counts = {}
+        for values, count in self.groups:
+            if expr.matches(values):
+                key = tuple(values[field] for field in fields)
+                counts[key] = counts.get(key, 0) + count
+
+        return [(list(key), count) for key, count in counts.items()]
+
+    def __addChild(self, item, child, existing):
+        newFilters = child.data(0, self.FiltersRole)
+        existingChild = existing.pop(newFilters, None)
+        if existingChild:
+            # Keep loaded and expanded subtree
+            existingChild.setText(1, child.text(1))
+            return
+
+        if self.show_tree_counts:
+            child.setTextAlignment(1, Qt.AlignRight)
+
+        if self.treeParam.fieldNames(child.data(0, self.ParamRole) + 1):
+            child.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+        item.addChild(child)
+
+        # Restore selection
+        extFilter = self.model.extFilter
+        if isinstance(extFilter, Expr):
+            extFilter = extFilter.toSql()
+        if newFilters == extFilter:
+            self.currentItemChanged.disconnect(self.itemActivatedEvent)
+            self.setCurrentItem(child)
+            self.currentItemChanged.connect(self.itemActivatedEvent)
+
     def __updateChilds(self, item, paramIndex=0, filters=''):
         fields = self.treeParam.fieldNames(paramIndex)
         if not fields:
             return
 
-        sql = "SELECT DISTINCT %s FROM coins" % ','.join(fields)
-        if filters:
-            sql += " WHERE " + filters
-        query = QtSql.QSqlQuery(sql, self.db)
+        conditions = item.data(0, self.ConditionsRole)
+
+        existing = {}
+        for i in range(item.childCount()):
+            child = item.child(i)
+            existing[child.data(0, self.FiltersRole)] = child
+
         hasEmpty = False
-        while query.next():
-            record = query.record()
+        emptyCount = 0
+        for values, count in self.__selectDistinct(fields, paramIndex, filters, conditions):
             data = []
             orig_data = []
-            filterSql = []
-            for i in range(record.count()):
-                if record.isNull(i):
+            childConditions = list(conditions)
+            for i, value in enumerate(values):
+                if value is None:
                     hasEmpty = True
+                    if count:
+                        emptyCount += count
                     continue
 
-                orig_data.append(record.value(i))
-                text = str(record.value(i))
+                orig_data.append(value)
+                text = str(value)
                 if text:
                     if fields[i] == 'status':
                         data.append(Statuses[text])
@@ -296,77 +452,127 @@ class TreeView(QTreeWidget):
                         data.append(label)
                     else:
                         data.append(text)
-                    escapedText = text.replace("'", "''")
-                    filterSql.append("%s='%s'" % (fields[i], escapedText))
+                    childConditions.append((fields[i], text))
                 else:
                     hasEmpty = True
+                    if count:
+                        emptyCount += count
 
             if data:
                 if len(data) > 1:
-                    newFilters = ' AND '.join(filterSql)
                     text = ' '.join(data)
                     child = TreeWidgetItem([text, ])
                     child.setData(0, self.SortDataRole, orig_data)
                 else:
-                    newFilters = filterSql[0]
                     child = TreeWidgetItem(data)
                     child.setData(0, self.SortDataRole, orig_data)
 
-                if filters:
-                    newFilters = filters + ' AND ' + newFilters
+                newFilters = conditionsExpr(childConditions).toSql()
 
                 child.setData(0, self.ParamRole, paramIndex)
                 child.setData(0, self.FiltersRole, newFilters)
                 child.setData(0, self.FieldsRole, fields)
+                child.setData(0, self.ConditionsRole, childConditions)
+                if count is not None:
+                    child.setText(1, str(count))
 
-                if self.show_tree_icons:
+                if newFilters not in existing and self.show_tree_icons:
                     icon = self.reference.getIcon(fields[0], data[0])
                     if icon:
                         child.setIcon(0, icon)
 
-                item.addChild(child)
-
-                # Restore selection
-                if newFilters == self.model.extFilter:
-                    self.currentItemChanged.disconnect(self.itemActivatedEvent)
-                    self.setCurrentItem(child)
-                    self.currentItemChanged.connect(self.itemActivatedEvent)
+                self.__addChild(item, child, existing)
 
         item.sortChildren(0, Qt.AscendingOrder)
 
-        if hasEmpty and len(fields) == 1 and item.childCount() > 0:
+        if hasEmpty and len(fields) == 1 and item.childCount() > len(existing):
             text = self.tr("Other")
-            newFilters = "ifnull(%s,'')=''" % fields[0]
-            if filters:
-                newFilters = filters + ' AND ' + newFilters
+            childConditions = conditions + [(fields[0], None)]
+            newFilters = conditionsExpr(childConditions).toSql()
 
             child = QTreeWidgetItem([text, ])
             child.setData(0, self.ParamRole, paramIndex)
             child.setData(0, self.FiltersRole, newFilters)
             child.setData(0, self.FieldsRole, fields)
-            item.addChild(child)
-
-            # Restore selection
-            if newFilters == self.model.extFilter:
-                self.currentItemChanged.disconnect(self.itemActivatedEvent)
-                self.setCurrentItem(child)
-                self.currentItemChanged.connect(self.itemActivatedEvent)
+            child.setData(0, self.ConditionsRole, childConditions)
+            if self.show_tree_counts:
+                child.setText(1, str(emptyCount))
+            self.__addChild(item, child, existing)
+
+        # Remove disappeared children
+        self.currentItemChanged.disconnect(self.itemActivatedEvent)
+        for child in existing.values():
+            item.removeChild(child)
+        self.currentItemChanged.connect(self.itemActivatedEvent)
 
         # Recursion for next field if nothing selected
         if item.childCount() == 0:
             self.__updateChilds(item, paramIndex + 1, filters)
 
     def modelChanged(self):
+        # Tree depends only on coins, so changing of list filters doesn't
+        # rebuild it
         if self.changingEnabled:
-            self.collapseAll()
             rootItem = self.topLevelItem(0)
+            if rootItem.data(0, self.LoadedRole) is None:
+                self.rebuild()
 
-            self.currentItemChanged.disconnect(self.itemActivatedEvent)
-            rootItem.takeChildren()  # remove all children
-            self.currentItemChanged.connect(self.itemActivatedEvent)
+    def rebuild(self):
+        self.cache.clear()
+        self.groups = None
+
+        self.collapseAll()
+        rootItem = self.topLevelItem(0)
+
+        self.currentItemChanged.disconnect(self.itemActivatedEvent)
+        rootItem.takeChildren()  # remove all children
+        rootItem.setData(0, self.LoadedRole, None)
+        self.currentItemChanged.connect(self.itemActivatedEvent)
 
-            self.__updateChilds(rootItem)
-            self.expandItem(rootItem)
+        self.__loadChilds(rootItem)
+        self.expandItem(rootItem)
+
+        if self.show_tree_counts:
+            self.__updateTotalCount()
+
+    def __updateTotalCount(self):
+        if self.groups is None:
+            self.__loadGroups()
+
+        rootItem = self.topLevelItem(0)
+        rootItem.setText(1, str(sum(count for _values, count in self.groups)))
+        rootItem.setTextAlignment(1, Qt.AlignRight)
+        self.resizeColumnToContents(0)
+
+    def coinsChanged(self, records):
+        if self.show_tree_counts:
+            # Counts of all ancestors are changed, so tree is rebuilt from
+            # new groups
+            if self.groups is not None:
+                self.groups = None
+                self.cache.clear()
+                self.__refreshItems(self.topLevelItem(0))
+                self.__updateTotalCount()
+            return
+
+        keys = set()
+        for record, _delta in records:
+            keys.update(self.cache.invalidate(record))
+
+        if keys:
+            self.__refreshItems(self.topLevelItem(0), keys)
+
+    def __refreshItems(self, item, keys=None):
+        key = item.data(0, self.LoadedRole)
+        if key is None:
+            return
+
+        if keys is None or key in keys:
+            paramIndex, filters = key
+            self.__updateChilds(item, paramIndex, filters)
+
+        for i in range(item.childCount()):
+            self.__refreshItems(item.child(i), keys)
 
     def rowChangedEvent(self, current):
         if self.changingEnabled:
@@ -378,6 +584,8 @@ class TreeView(QTreeWidget):
         if not parent:
             parent = self.topLevelItem(0)
 
+        self.__loadChilds(parent)
+
         for i in range(parent.childCount()):
             subItem = parent.child(i)
             fields = subItem.data(0, self.FieldsRole)
@@ -419,7 +627,12 @@ class TreeView(QTreeWidget):
         self.resizeColumnToContents(0)
 
         self.changingEnabled = False
-        filter_ = current.data(0, self.FiltersRole)
+        # Expression allows checking changed coins against filter in memory
+        conditions = current.data(0, self.ConditionsRole)
+        if conditions is not None:
+            filter_ = conditionsExpr(conditions)
+        else:
+            filter_ = current.data(0, self.FiltersRole)
         self.model.setAdditionalFilter(filter_)
         self.changingEnabled = True
 
@@ -439,7 +652,7 @@ class TreeView(QTreeWidget):
         dialog = CustomizeTreeDialog(self.model, self.treeParam, self)
         if dialog.exec_() == QDialog.Accepted:
             self.treeParam.save()
-            self.modelChanged()
+            self.rebuild()
 
     def _addCoin(self):
         self.changingEnabled = False
@@ -447,14 +660,18 @@ class TreeView(QTreeWidget):
         # TODO: This change ListView!
         self.model.setFilter('')
         self.changingEnabled = True
+        self.model.fetchAll()
 
         newRecord = self.model.record()
         # Fill new record with values of first record
+        firstRecord = self.model.record(0)
         for j in range(newRecord.count()):
-            newRecord.setValue(j, self.model.record(0).value(j))
+            newRecord.setValue(j, firstRecord.value(j))
 
         for i in range(self.model.rowCount()):
-            record = self.model.record(i)
+            record = self.model.record(i, lazy=True)
+            self.model.loadImages(record, [field for field in ImageFields + ('image',)
+                                           if not newRecord.isNull(field)])
             for j in range(newRecord.count()):
                 value = record.value(j)
                 if newRecord.value(j) != value or not value:
@@ -469,12 +686,15 @@ class TreeView(QTreeWidget):
         storedFilter = self.model.intFilter
         self.model.setFilter('')
         self.changingEnabled = True
+        self.model.fetchAll()
 
         # Fill multi record for editing
         multiRecord = self.model.record(0)
         usedFields = [Qt.Checked] * multiRecord.count()
         for i in range(self.model.rowCount()):
-            record = self.model.record(i)
+            record = self.model.record(i, lazy=True)
+            self.model.loadImages(record, [field for field in ImageFields + ('image',)
+                                           if not multiRecord.isNull(field)])
             for j in range(multiRecord.count()):
                 value = record.value(j)
                 if multiRecord.value(j) != value or not value:
@@ -496,7 +716,7 @@ class TreeView(QTreeWidget):
                 if progressDlg.wasCanceled():
                     break
 
-                record = self.model.record(i)
+                record = self.model.record(i, lazy=True)
                 for j in range(multiRecord.count()):
                     if usedFields[j] == Qt.Checked:
                         record.setValue(j, multiRecord.value(j))
@@ -528,7 +748,7 @@ class DetailsView(QWidget):
 
     def rowChangedEvent(self, current):
         if current.isValid():
-            record = self.model.record(current.row())
+            record = self.model.record(current.row(), lazy=True)
             self.widget.fillItems(record)
         else:
             self.widget.clear()
@@ -657,6 +877,14 @@ class PageView(Splitter):
         elif self.param.info_type == CollectionPageTypes.Map:
             self.mapView.modelChanged()
 
+    def stopStatistics(self):
+        if statisticsAvailable:
+            self.statisticsView.clear()
+
+    def restartStatistics(self):
+        if self.param.info_type == CollectionPageTypes.Statistics:
+            self.statisticsView.modelChanged()
+
     def prepareInfo(self):
         sizes = self.splitter1.sizes()
 
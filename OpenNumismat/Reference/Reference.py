@@ -275,9 +275,16 @@ class CrossReferenceSection(BaseReferenceSection):
 
 
 class Reference(QtCore.QObject):
+    # Revisions are unique for all references, so values cached for
+    # replaced reference are outdated too
+    lastRevision = 0
+
     def __init__(self, fields, parent=None, db=None):
         super().__init__(parent)
 
+        self.revision = None
+        self.nextRevision()
+
         if db:
             self.db = db
         else:
@@ -319,6 +326,10 @@ class Reference(QtCore.QObject):
             ref_edge = ReferenceSection('edge', self.tr("Edge"))
             self.sections.append(ref_edge)
 
+        # Section is changed by its dialog
+        for section in self.sections:
+            section.changed.connect(self.nextRevision)
+
     def __createReferenceSection(self, parentRef, field,
                                  letter='', sort=False):
         if field.name in self.userFields:
@@ -458,6 +469,13 @@ class Reference(QtCore.QObject):
 
         return sectionNames
 
+    def dataRevision(self):
+        return self.revision
+
+    def nextRevision(self, *_args):
+        Reference.lastRevision += 1
+        self.revision = Reference.lastRevision
+
     def getIcon(self, section, value):
         if section in ('payplace', 'saleplace'):
             section = 'place'
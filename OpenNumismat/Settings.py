@@ -79,6 +79,7 @@ class Settings(BaseSettings):
                'backup': OpenNumismat.HOME_PATH + "/backup/",
                'autobackup': True,
                'autobackup_depth': 25,
+               'backup_keep': 20,
                'reference': OpenNumismat.HOME_PATH + "/reference.ref",
                'error': True,
                'speedup': 1,
@@ -110,7 +111,7 @@ class Settings(BaseSettings):
                    'colnect_skip_currency', 'verify_ssl', 'built_in_viewer'):
             value = self.settings.value('mainwindow/' + key, self.Default[key],
                                         type=bool)
-        elif key in ('images_by_default', 'autobackup_depth',
+        elif key in ('images_by_default', 'autobackup_depth', 'backup_keep',
                      'speedup', 'map_type'):
             value = self.settings.value('mainwindow/' + key, self.Default[key],
                                         type=int)
@@ -61,6 +61,10 @@ class MainSettingsPage(QWidget):
 
         layout.addRow(self.tr("Reference"), hLayout)
 
+        backupLayout = QFormLayout()
+        backupLayout.setRowWrapPolicy(QFormLayout.WrapLongRows)
+        backup = QGroupBox(self.tr("Backup"), self)
+
         self.backupFolder = QLineEdit(self)
         self.backupFolder.setMinimumWidth(120)
         self.backupFolder.setText(settings['backup'])
@@ -73,22 +77,34 @@ class MainSettingsPage(QWidget):
         hLayout.addWidget(self.backupFolderButton)
         hLayout.setContentsMargins(QMargins())
 
-        layout.addRow(self.tr("Backup folder"), hLayout)
+        backupLayout.addRow(self.tr("Backup folder"), hLayout)
 
         self.autobackup = QCheckBox(self.tr("Make autobackup"), self)
         self.autobackup.setChecked(settings['autobackup'])
         self.autobackup.stateChanged.connect(self.autobackupClicked)
-        layout.addRow(self.autobackup)
+        backupLayout.addRow(self.autobackup)
 
         self.autobackupDepth = QSpinBox(self)
         self.autobackupDepth.setRange(1, 1000)
         self.autobackupDepth.setValue(settings['autobackup_depth'])
         self.autobackupDepth.setSizePolicy(QSizePolicy.Fixed,
                                            QSizePolicy.Fixed)
-        layout.addRow(self.tr("Coin changes before autobackup"),
-                      self.autobackupDepth)
+        backupLayout.addRow(self.tr("Coin changes before autobackup"),
+                            self.autobackupDepth)
         self.autobackupDepth.setEnabled(settings['autobackup'])
 
+        # Older backups and their data not shared with kept ones are
+        # removed after each backup
+        self.backupKeep = QSpinBox(self)
+        self.backupKeep.setRange(1, 1000)
+        self.backupKeep.setValue(settings['backup_keep'])
+        self.backupKeep.setSizePolicy(QSizePolicy.Fixed,
+                                      QSizePolicy.Fixed)
+        backupLayout.addRow(self.tr("Backups to keep"), self.backupKeep)
+
+        backup.setLayout(backupLayout)
+        layout.addRow(backup)
+
         self.errorSending = QCheckBox(
                             self.tr("Send error info to author"), self)
         self.errorSending.setChecked(settings['error'])
@@ -179,6 +195,7 @@ class MainSettingsPage(QWidget):
         settings['backup'] = self.backupFolder.text()
         settings['autobackup'] = self.autobackup.isChecked()
         settings['autobackup_depth'] = self.autobackupDepth.value()
+        settings['backup_keep'] = self.backupKeep.value()
         settings['reference'] = self.reference.text()
         settings['error'] = self.errorSending.isChecked()
         settings['updates'] = self.checkUpdates.isChecked()
@@ -235,6 +252,16 @@ class CollectionSettingsPage(QWidget):
         self.storeSorting.setChecked(self.settings['store_sorting'])
         layout.addRow(self.storeSorting)
 
+        self.sqlSorting = QCheckBox(
+                    self.tr("Sort list in database (faster for big collections)"), self)
+        self.sqlSorting.setChecked(self.settings['sql_sorting'])
+        layout.addRow(self.sqlSorting)
+
+        self.externalImages = QCheckBox(
+                    self.tr("Store new photos in files near collection"), self)
+        self.externalImages.setChecked(self.settings['external_images'])
+        layout.addRow(self.externalImages)
+
         self.imagesAtBottom = QCheckBox(self.tr("Images at bottom"), self)
         self.imagesAtBottom.setChecked(self.settings['images_at_bottom'])
         layout.addRow(self.imagesAtBottom)
@@ -247,6 +274,11 @@ class CollectionSettingsPage(QWidget):
         self.richText.setChecked(self.settings['rich_text'])
         layout.addRow(self.richText)
 
+        self.showTreeCounts = QCheckBox(
+                    self.tr("Show coins count in tree (build tree by one query)"), self)
+        self.showTreeCounts.setChecked(self.settings['show_tree_counts'])
+        layout.addRow(self.showTreeCounts)
+
         vLayout = QVBoxLayout()
         showIcons = QGroupBox(self.tr("Show icons from reference (slow)"), self)
         self.showTreeIcons = QCheckBox(self.tr("in tree"), self)
@@ -289,7 +321,10 @@ class CollectionSettingsPage(QWidget):
         self.settings['free_numeric'] = self.freeNumeric.isChecked()
         self.settings['convert_fraction'] = self.convertFraction.isChecked()
         self.settings['store_sorting'] = self.storeSorting.isChecked()
+        self.settings['sql_sorting'] = self.sqlSorting.isChecked()
+        self.settings['external_images'] = self.externalImages.isChecked()
         self.settings['show_tree_icons'] = self.showTreeIcons.isChecked()
+        self.settings['show_tree_counts'] = self.showTreeCounts.isChecked()
         self.settings['show_filter_icons'] = self.showFilterIcons.isChecked()
         self.settings['show_list_icons'] = self.showListIcons.isChecked()
         self.settings['ImageSideLen'] = int(self.imageSideLen.text())
@@ -1,12 +1,17 @@
+import os
+import sqlite3
 from textwrap import wrap
+from urllib.request import pathname2url
 
-from PyQt5.QtCore import Qt, QPoint, QMargins, QSize, QDateTime, QByteArray
+from PyQt5.QtCore import Qt, QPoint, QMargins, QSize, QDateTime, QByteArray, QThread
 from PyQt5.QtGui import QImage, QIcon
 from PyQt5.QtSql import QSqlQuery
 from PyQt5.QtWidgets import *
 
 import OpenNumismat
 from OpenNumismat.Collection.CollectionFields import Statuses
+from OpenNumismat.Collection.FilterExpr import Raw, Eq, In
+from OpenNumismat.Collection.StatisticsCache import StatisticsGroups
 from OpenNumismat.Tools.Gui import getSaveFileName, ProgressDialog
 from OpenNumismat.Tools.Converters import numberWithFraction
 from OpenNumismat.Tools.CursorDecorators import waitCursorDecorator
@@ -61,6 +66,52 @@ except ImportError:
             pass
 
 
+class StatisticsWorker(QThread):
+    """Runs statistics query on own read-only connection to collection"""
+
+    def __init__(self, fileName, sql, params, parent=None):
+        super().__init__(parent)
+
+        self.fileName = fileName
+        self.sql = sql
+        self.params = params
+        self.db = None
+        self.canceled = False
+        self.rows = None
+        self.error = None
+
+    def cancel(self):
+        self.canceled = True
+        db = self.db
+        if db:
+            try:
+                # Stops running query, it's allowed from other thread
+                db.interrupt()
+            except sqlite3.ProgrammingError:
+                pass
+
+    def run(self):
+        uri = 'file:%s?mode=ro' % pathname2url(os.path.abspath(self.fileName))
+        try:
+            self.db = sqlite3.connect(uri, uri=True)
+            try:
+                if self.canceled:
+                    return
+
+                rows = []
+                for row in self.db.execute(self.sql, self.params):
+                    # Like QtSql, NULL values are empty strings
+                    rows.append(['' if value is None else value for value in row])
+                self.rows = rows
+            finally:
+                db = self.db
+                self.db = None
+                db.close()
+        except sqlite3.Error as error:
+            if not self.canceled:
+                self.error = str(error)
+
+
 class GeoChartCanvas(QWebView):
     HTML = """
 <html>
@@ -152,7 +203,9 @@ class BaseCanvas(FigureCanvas):
 
         self.label = QApplication.translate('BaseCanvas', "Number of coins")
 
+        self.figures = None
         self.colors = None
+        self.drawnColors = None
         self.multicolors = (
             '#336699', '#99CCFF', '#999933', '#666699', '#CC9933', '#006666',
             '#3399FF', '#993300', '#CCCC99', '#666666', '#FFCC66', '#6699CC',
@@ -169,6 +222,12 @@ class BaseCanvas(FigureCanvas):
     def setLabel(self, text):
         self.label = text
 
+    def isUpdatable(self, yy):
+        # Artists are updated in place while number of items and colors
+        # are unchanged
+        return (self.figures is not None and len(self.figures) == len(yy)
+                and self.drawnColors == self.colors)
+
     def setLabelY(self, text):
         self.label_y = text
 
@@ -208,42 +267,58 @@ class BarCanvas(BaseCanvas):
         self.xx = xx
         self.yy = yy
 
-        self.axes.cla()
+        if self.isUpdatable(yy):
+            for bar, y in zip(self.figures, yy):
+                bar.set_height(y)
+            self.axes.relim()
+            self.axes.autoscale_view()
+        else:
+            self.axes.cla()
+
+            x = range(len(yy))
+            self.figures = self.axes.bar(x, yy, color=self.colors)
+            self.drawnColors = self.colors
+            self.axes.set_xticks(x)
+
+            ya = self.axes.get_yaxis()
+            ya.set_major_locator(MaxNLocator(integer=True))
 
-        x = range(len(yy))
-        self.figures = self.axes.bar(x, yy, color=self.colors)
-        self.axes.set_xticks(x)
         keys = ['\n'.join(wrap(l, 17)) for l in xx]
         self.axes.set_xticklabels(keys)
-
         self.axes.set_ylabel(self.label)
-        ya = self.axes.get_yaxis()
-        ya.set_major_locator(MaxNLocator(integer=True))
 
-        self.draw()
+        self.draw_idle()
 
 
 class BarHCanvas(BaseCanvas):
     def setData(self, xx, yy):
-        self.axes.cla()
-
         xx = xx[::-1]  # xx.reverse()
         yy = yy[::-1]  # yy.reverse()
 
         self.xx = xx
         self.yy = yy
 
-        x = range(len(yy))
-        self.figures = self.axes.barh(x, yy, color=self.colors)
-        self.axes.set_yticks(x)
+        if self.isUpdatable(yy):
+            for bar, y in zip(self.figures, yy):
+                bar.set_width(y)
+            self.axes.relim()
+            self.axes.autoscale_view()
+        else:
+            self.axes.cla()
+
+            x = range(len(yy))
+            self.figures = self.axes.barh(x, yy, color=self.colors)
+            self.drawnColors = self.colors
+            self.axes.set_yticks(x)
+
+            xa = self.axes.get_xaxis()
+            xa.set_major_locator(MaxNLocator(integer=True))
+
         keys = ['\n'.join(wrap(l, 17)) for l in xx]
         self.axes.set_yticklabels(keys)
-
         self.axes.set_xlabel(self.label)
-        xa = self.axes.get_xaxis()
-        xa.set_major_locator(MaxNLocator(integer=True))
 
-        self.draw()
+        self.draw_idle()
 
 
 class PieCanvas(BaseCanvas):
@@ -253,11 +328,12 @@ class PieCanvas(BaseCanvas):
 
         self.axes.cla()
 
+        # Wedges depend on all values, so only axes are reused
         keys = ['\n'.join(wrap(l, 17)) for l in xx]
         self.figures = self.axes.pie(yy, labels=keys, colors=self.multicolors)[0]
         self.axes.axis('equal')
 
-        self.draw()
+        self.draw_idle()
 
 
 class StackedBarCanvas(BaseCanvas):
@@ -277,7 +353,8 @@ class StackedBarCanvas(BaseCanvas):
 
         self.figures = []
         lines = []
-        prev_y = [0 * len(xx)]
+        # Left edges of bars are sums of previous rows
+        lefts = numpy.cumsum(yy, axis=0) - yy
         progressDlg = ProgressDialog(self.tr("Building chart"),
                                 self.tr("Cancel"), len(yy), self)
         progressDlg.setMinimumDuration(2000)
@@ -287,10 +364,8 @@ class StackedBarCanvas(BaseCanvas):
                 return
 
             color = self.multicolors[i % len(self.multicolors)]
-            bars = self.axes.barh(x, y, left=prev_y, color=color)
-            for bar in bars:
-                self.figures.append(bar)
-            prev_y = numpy.add(prev_y, y)
+            bars = self.axes.barh(x, y, left=lefts[i], color=color)
+            self.figures.extend(bars)
             lines.append(bars[0])
 
         progressDlg.setLabelText(self.tr("Drawing chart"))
@@ -305,7 +380,7 @@ class StackedBarCanvas(BaseCanvas):
 
         self.axes.legend(lines, zz, frameon=True)
 
-        self.draw()
+        self.draw_idle()
 
         progressDlg.reset()
 
@@ -313,7 +388,7 @@ class StackedBarCanvas(BaseCanvas):
         x = self.xx[pos % len(self.xx)]
         y = self.yy[pos // len(self.xx)][pos % len(self.xx)]
         z = self.zz[pos // len(self.xx)]
-        s = sum([yy[pos % len(self.xx)] for yy in self.yy])
+        s = self.yy[:, pos % len(self.xx)].sum()
         return "%s: %s\n%s: %s\n%s: %d/%d" % (self.label_y, x, self.label_z, z,
                                               self.label, y, s)
 
@@ -323,24 +398,35 @@ class ProgressCanvas(BaseCanvas):
         self.xx = xx
         self.yy = yy
 
-        self.axes.cla()
+        if self.isUpdatable(yy):
+            for bar, y in zip(self.figures, yy):
+                bar.set_height(y)
+            self.line.set_ydata(numpy.cumsum(yy))
+            self.axes.relim()
+            self.axes.autoscale_view()
+        else:
+            self.axes.cla()
+
+            x = range(len(yy))
+            self.figures = self.axes.bar(x, yy, color=self.colors)
+            self.drawnColors = self.colors
+            self.line, = self.axes.plot(x, numpy.cumsum(yy), color='red')
+            self.axes.set_xticks(x)
 
-        x = range(len(yy))
-        self.figures = self.axes.bar(x, yy, color=self.colors)
-        self.axes.plot(x, numpy.cumsum(yy), color='red')
+            ya = self.axes.get_yaxis()
+            ya.set_major_locator(MaxNLocator(integer=True))
 
-        self.axes.set_xticks(x)
         keys = ['\n'.join(wrap(l, 17)) for l in xx]
         self.axes.set_xticklabels(keys)
-
         self.axes.set_ylabel(self.label)
-        ya = self.axes.get_yaxis()
-        ya.set_major_locator(MaxNLocator(integer=True))
 
-        self.draw()
+        self.draw_idle()
 
 
 class StatisticsView(QWidget):
+    # Default limit of bound values in SQLite before 3.32
+    MAX_VARIABLES = 999
+
     def __init__(self, statisticsParam, parent=None):
         super().__init__(parent)
 
@@ -363,6 +449,11 @@ class StatisticsView(QWidget):
 
         self.chart = QWidget(self)
         self.chartLayout.addWidget(self.chart)
+        self.chartWidget = self.chart
+
+        self.placeholder = QLabel(self.tr("Calculating..."), self)
+        self.placeholder.setAlignment(Qt.AlignCenter)
+        self.placeholder.hide()
 
         self.chartSelector = QComboBox(self)
         self.chartSelector.addItem(self.tr("Bar"), 'bar')
@@ -431,6 +522,15 @@ class StatisticsView(QWidget):
 
     def setModel(self, model):
         self.model = model
+        self.chartState = None
+        self.charts = {}
+        # Statistics queries are run by worker on own connection
+        self.worker = None
+        self.requestKey = None
+        self.requestTarget = None
+        self.progressResult = None
+        # Request failed on own connection is repeated on main one
+        self.failedKey = None
 
         default_subfieldid = 0
         for field in self.model.fields.userFields:
@@ -492,95 +592,114 @@ class StatisticsView(QWidget):
         self.regionSelector.currentIndexChanged.connect(self.regionChanged)
 
     def clear(self):
-        pass
+        # Queries are stopped before collection is closed or changed
+        self.__cancelRequest()
+        for worker in self.findChildren(StatisticsWorker):
+            worker.wait()
 
     def modelChanged(self):
-        self.chartLayout.removeWidget(self.chart)
         chart = self.chartSelector.currentData()
-        if chart == 'geochart':
-            self.chart = GeoChartCanvas(self)
-        elif chart == 'barh':
-            self.chart = BarHCanvas(self)
-        elif chart == 'pie':
-            self.chart = PieCanvas(self)
-        elif chart == 'stacked':
-            self.chart = StackedBarCanvas(self)
-        elif chart == 'progress':
-            self.chart = ProgressCanvas(self)
-        else:
-            self.chart = BarCanvas(self)
-        self.chart.setMulticolor(self.colorCheck.checkState() == Qt.Checked)
-        self.chartLayout.addWidget(self.chart)
-
         fieldId = self.fieldSelector.currentData()
         field = self.model.fields.field(fieldId).name
         if field == 'fineness':
             field = 'material,fineness'
         elif field == 'unit':
             field = 'value,unit'
-        filter_ = self.model.filter()
-        if filter_:
-            sql_filter = "WHERE %s" % filter_
+
+        if chart == 'progress':
+            # Depends on current date, so it isn't cached
+            state = (chart, self.itemsSelector.currentData(),
+                     self.periodSelector.currentData(), self.model.filter(),
+                     self.model.dataRevision())
+            rows = self.__progressRows(state)
+            if rows is None:
+                return
         else:
-            sql_filter = ""
+            fields = field.split(',')
+            countField = None
+            if chart == 'geochart':
+                fields = ['country']
+            elif chart == 'stacked':
+                subfieldId = self.subfieldSelector.currentData()
+                subfield = self.model.fields.field(subfieldId).name
+                fields.append(subfield)
+                countField = subfield
+
+            groups = self.__groups(fields, countField)
+            if groups is None:
+                return
+            rows = groups.rows()
+            # State keeps drawn groups alive, so they are compared by
+            # identity and can't be confused with reloaded ones
+            state = (chart, field, tuple(fields), groups, groups.version)
+
+        self.__cancelRequest()
+        self.__setChartWidget(self.chart)
+
+        # Chart is rebuilt only when its data or view is changed
+        state += (self.colorCheck.checkState(),
+                  self.regionSelector.currentData())
+        if state == self.chartState:
+            return
+        self.chartState = state
+
+        # Canvas of each chart type is created once and updated by new data
+        canvas = self.charts.get(chart)
+        if not canvas:
+            if chart == 'geochart':
+                canvas = GeoChartCanvas(self)
+            elif chart == 'barh':
+                canvas = BarHCanvas(self)
+            elif chart == 'pie':
+                canvas = PieCanvas(self)
+            elif chart == 'stacked':
+                canvas = StackedBarCanvas(self)
+            elif chart == 'progress':
+                canvas = ProgressCanvas(self)
+            else:
+                canvas = BarCanvas(self)
+            self.charts[chart] = canvas
+
+        self.__setChartWidget(canvas)
+        self.chart = canvas
+        self.chart.setMulticolor(self.colorCheck.checkState() == Qt.Checked)
 
         if chart == 'geochart':
-            sql = "SELECT count(*), country FROM coins %s GROUP BY country" % sql_filter
-            query = QSqlQuery(self.model.database())
-            query.exec_(sql)
             xx = []
             yy = []
-            while query.next():
-                record = query.record()
-                count = record.value(0)
-                val = str(record.value(1))
+            for count, values in rows:
+                val = str(values[0])
                 xx.append(val)
                 yy.append(count)
 
             self.chart.setData(xx, yy, self.regionSelector.currentData())
         elif chart == 'stacked':
-            subfieldId = self.subfieldSelector.currentData()
-            subfield = self.model.fields.field(subfieldId).name
-            sql = "SELECT count(%s), %s, %s FROM coins %s GROUP BY %s, %s" % (
-                subfield, subfield, field, sql_filter, field, subfield)
-            query = QSqlQuery(self.model.database())
-            query.exec_(sql)
-            xx = []
-            yy = []
-            zz = []
-            vv = {}
-            while query.next():
-                record = query.record()
-                count = record.value(0)
-                val = str(record.value(2))
+            # Positions of categories in order of first appearance
+            xIndex = {}
+            zIndex = {}
+            cells = []
+            for count, values in rows:
+                val = str(values[0])
                 if field == 'status':
                     val = Statuses[val]
                 elif field == 'value,unit':
-                    val = numberWithFraction(val)[0] + ' ' + str(record.value(3))
+                    val = numberWithFraction(val)[0] + ' ' + str(values[1])
                 elif ',' in field:
-                    val += ' ' + str(record.value(3))
-                subval = str(record.value(1))
+                    val += ' ' + str(values[1])
+                subval = str(values[-1])
                 if subfield == 'status':
                     subval = Statuses[subval]
 
-                if val not in xx:
-                    xx.append(val)
-                if subval not in zz:
-                    zz.append(subval)
-                if val not in vv:
-                    vv[val] = {}
-                vv[val][subval] = count
-
-            for _ in range(len(zz)):
-                yy.append([0] * len(xx))
-
-            xx = xx[::-1]
-            for i, val in enumerate(xx):
-                for j, subval in enumerate(zz):
-                    try:
-                        yy[j][i] = vv[val][subval]
-                    except KeyError:
-                        pass
+                i = xIndex.setdefault(val, len(xIndex))
+                j = zIndex.setdefault(subval, len(zIndex))
+                cells.append((j, i, count))
+
+            xx = list(xIndex)[::-1]
+            zz = list(zIndex)
+            yy = numpy.zeros((len(zz), len(xx)), dtype=int)
+            if cells:
+                jj, ii, counts = numpy.array(cells, dtype=int).T
+                yy[jj, len(xx) - 1 - ii] = counts
 
             self.chart.setData(xx, yy, zz)
             self.chart.setLabelY(self.fieldSelector.currentText())
@@ -588,98 +707,208 @@ class StatisticsView(QWidget):
         elif chart == 'progress':
             items = self.itemsSelector.currentData()
             if items == 'price':
-                sql_field = 'sum(payprice)'
                 self.chart.setLabel(self.tr("Paid"))
             elif items == 'totalprice':
-                sql_field = 'sum(totalpayprice)'
                 self.chart.setLabel(self.tr("Total paid"))
-            elif items == 'count':
-                sql_field = 'count(*)'
-                self.chart.setLabel(self.tr("Number of coins"))
             else:
-                sql_field = 'count(*)'
                 self.chart.setLabel(self.tr("Number of coins"))
 
-            period = self.periodSelector.currentData()
-            if items == 'created':
-                if period == 'month':
-                    sql_filters = ["createdat >= datetime('now', 'start of month', '-11 months')"]
-                elif period == 'week':
-                    sql_filters = ["createdat > datetime('now', '-11 months')"]
-                elif period == 'day':
-                    sql_filters = ["createdat > datetime('now', '-1 month')"]
-                else:  # year
-                    sql_filters = ["1=1"]
-            else:
-                sql_filters = ["status IN ('owned', 'ordered', 'sale', 'missing')"]
-
-                if period == 'month':
-                    sql_filters.append("paydate >= datetime('now', 'start of month', '-11 months')")
-                elif period == 'week':
-                    sql_filters.append("paydate > datetime('now', '-11 months')")
-                elif period == 'day':
-                    sql_filters.append("paydate > datetime('now', '-1 month')")
-
-            if period == 'month':
-                date_format = '%m'
-            elif period == 'week':
-                date_format = '%W'
-            elif period == 'day':
-                date_format = '%d'
-            else:
-                date_format = '%Y'
-
-            if filter_:
-                sql_filters.append(filter_)
-
-            if items == 'created':
-                sql = "SELECT %s, strftime('%s', createdat) FROM coins"\
-                      " WHERE %s"\
-                      " GROUP BY strftime('%s', createdat) ORDER BY createdat" % (
-                          sql_field, date_format, ' AND '.join(sql_filters),
-                          date_format)
-            else:
-                sql = "SELECT %s, strftime('%s', paydate) FROM coins"\
-                      " WHERE %s"\
-                      " GROUP BY strftime('%s', paydate) ORDER BY paydate" % (
-                          sql_field, date_format, ' AND '.join(sql_filters),
-                          date_format)
-            query = QSqlQuery(self.model.database())
-            query.exec_(sql)
             xx = []
             yy = []
-            while query.next():
-                record = query.record()
-                count = record.value(0)
-                val = str(record.value(1))
+            for row in rows:
+                count = row[0]
+                val = str(row[1])
                 xx.append(val)
                 yy.append(count)
 
             self.chart.setData(xx, yy)
             self.chart.setLabelY(self.periodSelector.currentText())
         else:
-            sql = "SELECT count(*), %s FROM coins %s GROUP BY %s" % (
-                field, sql_filter, field)
-            query = QSqlQuery(self.model.database())
-            query.exec_(sql)
             xx = []
             yy = []
-            while query.next():
-                record = query.record()
-                count = record.value(0)
-                val = str(record.value(1))
+            for count, values in rows:
+                val = str(values[0])
                 if field == 'status':
                     val = Statuses[val]
                 elif field == 'value,unit':
-                    val = numberWithFraction(val)[0] + ' ' + str(record.value(2))
+                    val = numberWithFraction(val)[0] + ' ' + str(values[1])
                 elif ',' in field:
-                    val += ' ' + str(record.value(2))
+                    val += ' ' + str(values[1])
                 xx.append(val)
                 yy.append(count)
 
             self.chart.setData(xx, yy)
             self.chart.setLabelY(self.fieldSelector.currentText())
 
+    def __groups(self, fields, countField):
+        expr = self.model.filterExpr()
+        revision = self.model.dataRevision()
+        cache = self.model.statisticsCache
+        groups = cache.get(fields, countField, expr, revision)
+        if groups:
+            return groups
+
+        key = (tuple(fields), countField, expr.toSql(), revision)
+        if not self.__isAsync(expr, key):
+            return cache.load(self.model.database(), fields, countField,
+                              expr, revision)
+
+        groups = StatisticsGroups(fields, countField, expr, revision)
+        self.__request(key, groups.statement(tables=False), groups)
+        return None
+
+    def __progressRows(self, state):
+        if self.progressResult and self.progressResult[0] == state:
+            return self.progressResult[1]
+
+        expr = self.model.filterExpr()
+        if not self.__isAsync(expr, state):
+            sql, params = self.__progressStatement(expr, tables=True)
+            query = QSqlQuery(self.model.database())
+            query.prepare(sql)
+            for pos, value in enumerate(params):
+                query.bindValue(pos, value)
+            query.exec_()
+            rows = []
+            while query.next():
+                record = query.record()
+                rows.append((record.value(0), record.value(1)))
+            return rows
+
+        self.__request(state, self.__progressStatement(expr, tables=False),
+                       state)
+        return None
+
+    def __progressStatement(self, expr, tables):
+        items = self.itemsSelector.currentData()
+        if items == 'price':
+            sql_field = 'sum(payprice)'
+        elif items == 'totalprice':
+            sql_field = 'sum(totalpayprice)'
+        else:
+            sql_field = 'count(*)'
+
+        period = self.periodSelector.currentData()
+        if items == 'created':
+            if period == 'month':
+                sql_filters = ["createdat >= datetime('now', 'start of month', '-11 months')"]
+            elif period == 'week':
+                sql_filters = ["createdat > datetime('now', '-11 months')"]
+            elif period == 'day':
+                sql_filters = ["createdat > datetime('now', '-1 month')"]
+            else:  # year
+                sql_filters = ["1=1"]
+        else:
+            sql_filters = ["status IN ('owned', 'ordered', 'sale', 'missing')"]
+
+            if period == 'month':
+                sql_filters.append("paydate >= datetime('now', 'start of month', '-11 months')")
+            elif period == 'week':
+                sql_filters.append("paydate > datetime('now', '-11 months')")
+            elif period == 'day':
+                sql_filters.append("paydate > datetime('now', '-1 month')")
+
+        if period == 'month':
+            date_format = '%m'
+        elif period == 'week':
+            date_format = '%W'
+        elif period == 'day':
+            date_format = '%d'
+        else:
+            date_format = '%Y'
+
+        where, params = expr.compile(tables)
+        if where:
+            sql_filters.append(where)
+
+        if items == 'created':
+            sql = "SELECT %s, strftime('%s', createdat) FROM coins"\
+                  " WHERE %s"\
+                  " GROUP BY strftime('%s', createdat) ORDER BY createdat" % (
+                      sql_field, date_format, ' AND '.join(sql_filters),
+                      date_format)
+        else:
+            sql = "SELECT %s, strftime('%s', paydate) FROM coins"\
+                  " WHERE %s"\
+                  " GROUP BY strftime('%s', paydate) ORDER BY paydate" % (
+                      sql_field, date_format, ' AND '.join(sql_filters),
+                      date_format)
+
+        return sql, params
+
+    def __isAsync(self, expr, key):
+        if key == self.failedKey:
+            return False
+
+        # Raw filters could refer to temporary tables of main connection.
+        # Large value lists are bound to worker query, on main connection
+        # they are stored in temporary tables
+        values = 0
+        for node in expr.walk():
+            if isinstance(node, Raw):
+                return False
+            elif isinstance(node, In):
+                values += len(node.values)
+            elif isinstance(node, Eq):
+                values += 1
+
+        return values <= self.MAX_VARIABLES
+
+    def __request(self, key, statement, target):
+        if self.worker and self.requestKey == key:
+            return
+
+        self.__cancelRequest()
+
+        sql, params = statement
+        self.worker = StatisticsWorker(self.model.database().databaseName(),
+                                       sql, params, self)
+        self.worker.finished.connect(self.__requestFinished)
+        self.requestKey = key
+        self.requestTarget = target
+        self.worker.start()
+
+        self.__setChartWidget(self.placeholder)
+
+    def __cancelRequest(self):
+        if self.worker:
+            # Outdated worker is deleted when finished
+            self.worker.cancel()
+            self.worker = None
+            self.requestKey = None
+            self.requestTarget = None
+
+    def __requestFinished(self):
+        worker = self.sender()
+        worker.deleteLater()
+        if worker is not self.worker:
+            return
+
+        key = self.requestKey
+        target = self.requestTarget
+        self.worker = None
+        self.requestKey = None
+        self.requestTarget = None
+
+        if worker.error:
+            # For example collection can't be opened by own connection
+            self.failedKey = key
+        elif isinstance(target, StatisticsGroups):
+            target.setRows(worker.rows)
+            self.model.statisticsCache.add(target)
+        else:
+            self.progressResult = (target, worker.rows)
+
+        self.modelChanged()
+
+    def __setChartWidget(self, widget):
+        if widget is not self.chartWidget:
+            self.chartLayout.removeWidget(self.chartWidget)
+            self.chartWidget.hide()
+            self.chartWidget = widget
+            self.chartLayout.addWidget(widget)
+            widget.show()
+
     def fieldChaged(self, _text):
         fieldId = self.fieldSelector.currentData()
         self.statisticsParam['fieldid'] = fieldId
@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from PyQt5.QtCore import Qt, QDate
-from PyQt5.QtSql import QSqlQuery
 from PyQt5.QtWidgets import QDialog, QTextEdit, QVBoxLayout, QDialogButtonBox
 
+from OpenNumismat.Collection.Summary import Summary
 from OpenNumismat.Tools.DialogDecorators import storeDlgSizeDecorator
 
 
@@ -34,167 +34,64 @@ class SummaryDialog(QDialog):
     def __fillSummary(self, model):
         lines = []
 
-        sql = "SELECT count(*) FROM coins"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            totalCount = query.record().value(0)
-            lines.append(self.tr("Total count: %d") % totalCount)
-
-        count_owned = 0
-        sql = "SELECT count(*) FROM coins WHERE status IN ('owned', 'ordered', 'sale')"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count_owned = query.record().value(0)
-            lines.append(self.tr("Count owned: %d") % count_owned)
-
-        sql = "SELECT count(*) FROM coins WHERE status='wish'"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count = query.record().value(0)
-            lines.append(self.tr("Count wish: %d") % count)
-
-        count_sold = 0
-        sql = "SELECT count(*) FROM coins WHERE status='sold'"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count_sold = query.record().value(0)
-            if count_sold > 0:
-                lines.append(self.tr("Count sales: %d") % count_sold)
-
-        sql = "SELECT count(*) FROM coins WHERE status='bidding'"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count = query.record().value(0)
-            if count > 0:
-                lines.append(self.tr("Count biddings: %d") % count)
-
-        sql = "SELECT count(*) FROM coins WHERE status='missing'"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count = query.record().value(0)
-            if count > 0:
-                lines.append(self.tr("Count missing: %d") % count)
-
-        paid = 0
+        summary = Summary(model.database()).calculate()
+
+        if 'count' in summary:
+            lines.append(self.tr("Total count: %d") % summary['count'])
+            lines.append(self.tr("Count owned: %d") % summary['owned'])
+            lines.append(self.tr("Count wish: %d") % summary['wish'])
+        if summary.get('sold'):
+            lines.append(self.tr("Count sales: %d") % summary['sold'])
+        if summary.get('bidding'):
+            lines.append(self.tr("Count biddings: %d") % summary['bidding'])
+        if summary.get('missing'):
+            lines.append(self.tr("Count missing: %d") % summary['missing'])
+
+        count_owned = summary.get('owned', 0)
+        count_sold = summary.get('sold', 0)
+
+        paid = summary.get('paid')
         commission = ""
-        sql = "SELECT SUM(totalpayprice) FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'sold', 'missing') AND totalpayprice<>'' AND totalpayprice IS NOT NULL"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            paid = query.record().value(0)
-            if paid:
-                sql = "SELECT SUM(payprice) FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'sold', 'missing') AND payprice<>'' AND payprice IS NOT NULL"
-                query = QSqlQuery(sql, model.database())
-                if query.first():
-                    paid_without_commission = query.record().value(0)
-                    if paid_without_commission:
-                        commission = self.tr("(commission %d%%)") % ((paid - paid_without_commission) / paid_without_commission * 100)
-                lines.append(' '.join((self.tr("Paid: %.2f") % paid, commission)))
-
-                if count_owned:
-                    lines.append(self.tr("Average paid per item: %.2f") % (paid / count_owned))
-
-        earned = 0
+        if paid:
+            paid_without_commission = summary['paid_without_commission']
+            if paid_without_commission:
+                commission = self.tr("(commission %d%%)") % ((paid - paid_without_commission) / paid_without_commission * 100)
+            lines.append(' '.join((self.tr("Paid: %.2f") % paid, commission)))
+
+            if count_owned:
+                lines.append(self.tr("Average paid per item: %.2f") % (paid / count_owned))
+
+        earned = summary.get('earned')
         commission = ""
-        sql = "SELECT SUM(totalsaleprice) FROM coins WHERE status='sold' AND totalsaleprice<>'' AND totalsaleprice IS NOT NULL"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            earned = query.record().value(0)
-            if earned:
-                sql = "SELECT SUM(saleprice) FROM coins WHERE status='sold' AND saleprice<>'' AND saleprice IS NOT NULL"
-                query = QSqlQuery(sql, model.database())
-                if query.first():
-                    earn_without_commission = query.record().value(0)
-                    if earn_without_commission:
-                        commission = self.tr("(commission %d%%)") % ((earn_without_commission - earned) / earn_without_commission * 100)
-                lines.append(' '.join((self.tr("Earned: %.2f") % earned, commission)))
-
-                if count_sold:
-                    lines.append(self.tr("Average earn per item: %.2f") % (earned / count_sold))
+        if earned:
+            earn_without_commission = summary['earned_without_commission']
+            if earn_without_commission:
+                commission = self.tr("(commission %d%%)") % ((earn_without_commission - earned) / earn_without_commission * 100)
+            lines.append(' '.join((self.tr("Earned: %.2f") % earned, commission)))
+
+            if count_sold:
+                lines.append(self.tr("Average earn per item: %.2f") % (earned / count_sold))
 
         if paid and earned:
             total = (paid - earned)
             lines.append(self.tr("Total (paid - earned): %.2f") % total)
 
-        sql = "SELECT paydate FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'sold', 'missing') AND paydate<>'' AND paydate IS NOT NULL ORDER BY paydate LIMIT 1"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            date = QDate.fromString(query.record().value(0), Qt.ISODate)
+        if summary.get('first_paydate'):
+            date = QDate.fromString(summary['first_paydate'], Qt.ISODate)
             paydate = date.toString(Qt.SystemLocaleShortDate)
             lines.append(self.tr("First purchase: %s") % paydate)
 
-        sql = "SELECT UPPER(grade), price1, price2, price3, price4 FROM coins WHERE status IN ('owned', 'ordered', 'sale') AND (ifnull(price1,'')<>'' OR ifnull(price2,'')<>'' OR ifnull(price3,'')<>'' OR ifnull(price4,'')<>'')"
-        query = QSqlQuery(sql, model.database())
-        est_owned = 0
-        count = 0
         comment = ""
-        while query.next():
-            record = query.record()
-            grade = record.value(0)
-            price1 = record.value(1)
-            price2 = record.value(2)
-            price3 = record.value(3)
-            price4 = record.value(4)
-
-            try:
-                if grade[:2] in ('UN', 'MS'):
-                    price = price4 if price4 else price3 * 1.6 if price3 else price2 * 2.2 if price2 else price1 * 5.5 if price1 else 0
-                elif grade[:2] in ('XF', 'EF'):
-                    price = price3 if price3 else price4 * 0.6 if price4 else price2 * 1.4 if price2 else price1 * 3.5 if price1 else 0
-                elif grade[:2] in ('AU',):
-                    priceU = price4 if price4 else price3 * 1.6 if price3 else price2 * 2.2 if price2 else price1 * 5.5 if price1 else 0
-                    priceX = price3 if price3 else price4 * 0.6 if price4 else price2 * 1.4 if price2 else price1 * 3.5 if price1 else 0
-                    price = priceX + (priceU - priceX) * 0.6
-                elif grade[:2] in ('VF',):
-                    price = price2 if price2 else price3 * 0.7 if price3 else price4 * 0.45 if price4 else price1 * 2.5 if price1 else 0
-                elif grade[:2] in ('F', 'FI'):
-                    price = price1 if price1 else price2 * 0.4 if price2 else price3 * 0.3 if price3 else price4 * 0.18 if price4 else 0
-                elif grade[:2] in ('VG',):
-                    price = price1 * 0.5 if price1 else price2 * 0.2 if price2 else price3 * 0.14 if price3 else price4 * 0.09 if price4 else 0
-                else:
-                    price = price4 if price4 else price3 if price3 else price2 if price2 else price1 if price1 else 0
-
-                if price:
-                    est_owned += price
-                    count += 1
-
-            except TypeError:
-                continue
-
-        if count:
-            comment = self.tr("(calculated for %d coins)") % count
-
-        lines.append(' '.join((self.tr("Estimation owned: %d") % est_owned, comment)))
-
-        sql = "SELECT price1, price2, price3, price4 FROM coins WHERE status='wish' AND (ifnull(price1,'')<>'' OR ifnull(price2,'')<>'' OR ifnull(price3,'')<>'' OR ifnull(price4,'')<>'')"
-        query = QSqlQuery(sql, model.database())
-        est_wish = 0
-        count = 0
+        if summary['estimation_owned_count']:
+            comment = self.tr("(calculated for %d coins)") % summary['estimation_owned_count']
+        lines.append(' '.join((self.tr("Estimation owned: %d") % summary['estimation_owned'], comment)))
+
         comment = ""
-        while query.next():
-            record = query.record()
-            price1 = record.value(0)
-            price2 = record.value(1)
-            price3 = record.value(2)
-            price4 = record.value(3)
-
-            price = price4 if price4 else price3 if price3 else price2 if price2 else price1 if price1 else 0
-
-            try:
-                if price:
-                    est_wish += price
-                    count += 1
-            except TypeError:
-                continue
-
-        if count:
-            comment = self.tr("(calculated for %d coins)") % count
-
-        lines.append(' '.join((self.tr("Estimation wish: %d") % est_wish, comment)))
-
-        sql = "SELECT count(*) FROM photos"
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count = query.record().value(0)
-            lines.append(self.tr("Count images: %d") % count)
+        if summary['estimation_wish_count']:
+            comment = self.tr("(calculated for %d coins)") % summary['estimation_wish_count']
+        lines.append(' '.join((self.tr("Estimation wish: %d") % summary['estimation_wish'], comment)))
+
+        if 'images' in summary:
+            lines.append(self.tr("Count images: %d") % summary['images'])
 
         self.textBox.setText('\n'.join(lines))
@@ -166,6 +166,7 @@ class TabView(QTabWidget):
         self.currentChanged.disconnect(self.activatedPage)
         for _ in range(self.count()):
             w = self.widget(0)
+            w.stopStatistics()
             self.removeTab(0)
             w.deleteLater()
         self.currentChanged.connect(self.activatedPage)
@@ -227,6 +228,7 @@ class TabView(QTabWidget):
         if index is None:
             index = self.currentIndex()
         page = self.widget(index)
+        page.stopStatistics()
         self.removeTab(index)
         self.collection.pages().closePage(page)
 
@@ -245,6 +247,7 @@ class TabView(QTabWidget):
                 QMessageBox.No)
         if result == QMessageBox.Yes:
             page = self.widget(index)
+            page.stopStatistics()
             self.removeTab(index)
             self.collection.pages().removePage(page.param)
 
@@ -258,6 +261,14 @@ class TabView(QTabWidget):
             for pageParam in closedPages:
                 self.collection.pages().removePage(pageParam)
 
+    def stopStatistics(self):
+        for i in range(self.count()):
+            self.widget(i).stopStatistics()
+
+    def restartStatistics(self):
+        for i in range(self.count()):
+            self.widget(i).restartStatistics()
+
     def savePagePositions(self, only_if_changed=False):
         if not only_if_changed or self.__pages_changed:
             pages = []
@@ -307,6 +318,7 @@ class TabView(QTabWidget):
         pageParam.listParam.store_sorting = settings['store_sorting']
         pageParam.treeParam.show_tree_icons = settings['show_tree_icons']
         pageParam.treeParam.convert_fraction = settings['convert_fraction']
+        pageParam.treeParam.show_tree_counts = settings['show_tree_counts']
 
         pageView = PageView(pageParam, self)
         pageView.setModel(self.collection.model(), self.collection.reference)
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+
+class LruCache:
+    """Least recently used cache limited by total size of stored values"""
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._items = OrderedDict()
+
+    def get(self, key):
+        try:
+            value, _size = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        self.remove(key)
+
+        size = len(value)
+        if size > self.maxSize:
+            return
+
+        self._items[key] = (value, size)
+        self.size += size
+
+        while self.size > self.maxSize:
+            _key, (_value, size) = self._items.popitem(last=False)
+            self.size -= size
+
+    def remove(self, key):
+        item = self._items.pop(key, None)
+        if item:
+            self.size -= item[1]
+
+    def clear(self):
+        self._items.clear()
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
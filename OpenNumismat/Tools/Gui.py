@@ -17,6 +17,10 @@ class ProgressDialog(QProgressDialog):
     def step(self):
         self.setValue(self.value() + 1)
 
+    def setProgress(self, value, maximum):
+        self.setMaximum(maximum)
+        self.setValue(value)
+
     # Reimplementing default method for showing updated label immediately
     def setLabelText(self, text):
         super().setLabelText(text)
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+
+from PyQt5.QtSql import QSqlQuery
+
+
+class StatementPool:
+    """Prepared statements reused across calls on a single connection.
+
+    Least recently used statements are finalized when pool is full, so
+    frequent lookups stay prepared while generated filter SQL changes.
+    """
+    # Statements with generated SQL (filters) could have many shapes
+    MAX_SIZE = 256
+
+    def __init__(self, db):
+        self.db = db
+        self._queries = OrderedDict()
+
+    def query(self, sql):
+        query = self._queries.get(sql)
+        if query is not None:
+            self._queries.move_to_end(sql)
+        else:
+            query = QSqlQuery(self.db)
+            query.setForwardOnly(True)
+            if not query.prepare(sql):
+                return query
+
+            if len(self._queries) >= self.MAX_SIZE:
+                _sql, oldest = self._queries.popitem(last=False)
+                oldest.finish()
+            self._queries[sql] = query
+
+        return query
+
+    def exec_(self, sql, params=()):
+        query = self.query(sql)
+        for pos, value in enumerate(params):
+            query.bindValue(pos, value)
+        query.exec_()
+
+        return query
+
+    def clear(self):
+        # Prepared statements are finalized when connection is closed
+        for query in self._queries.values():
+            query.finish()
+        self._queries.clear()